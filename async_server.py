@@ -0,0 +1,136 @@
+import asyncio
+import json
+import struct
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Cada quadro: tamanho (4 bytes, big-endian) seguido do corpo JSON
+FRAME_HEADER = struct.Struct('>I')
+MAX_FRAME_SIZE = 1024 * 1024
+
+# Operações do ChatServer expostas pelo front-end asyncio
+OPERATIONS = {
+    'register_user', 'update_location', 'get_nearby_users', 'send_message',
+    'get_offline_messages', 'fetch_offline_messages', 'user_heartbeat', 'remove_user', 'report',
+}
+
+# Operações que podem bloquear e rodam fora do event loop: send_message chama o cliente
+# via Pyro e grava no spool; as demais retiram mensagens do índice offline (SQLite, sob
+# o lock que o consumidor segura ao gravar cada lote), diretamente ou ao entregar as
+# pendentes de quem entrou no alcance, ou consultam outros shards via Pyro
+BLOCKING_OPERATIONS = {
+    'send_message', 'register_user', 'update_location', 'report',
+    'get_offline_messages', 'fetch_offline_messages',
+}
+
+# Com shards, estas também consultam os shards vizinhos via Pyro
+SHARDED_BLOCKING_OPERATIONS = {'get_nearby_users'}
+
+
+async def read_frame(reader):
+    """Lê um quadro e retorna o objeto JSON, ou None no fim da conexão"""
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"Quadro muito grande: {size} bytes")
+    return json.loads(await reader.readexactly(size))
+
+
+def write_frame(writer, payload):
+    body = json.dumps(payload).encode('utf-8')
+    writer.write(FRAME_HEADER.pack(len(body)) + body)
+
+
+class AsyncChatServer:
+    """Front-end asyncio para o ChatServer: uma corrotina por conexão em vez de uma thread"""
+
+    def __init__(self, chat_server, host='localhost', port=9091, blocking_workers=8):
+        self.chat_server = chat_server
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=blocking_workers)
+        self.blocking_operations = set(BLOCKING_OPERATIONS)
+        if chat_server.shard_map.sharded:
+            self.blocking_operations |= SHARDED_BLOCKING_OPERATIONS
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        logger.info("Servidor asyncio disponível em %s:%d", self.host, self.port)
+        return self.server
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await read_frame(reader)
+                if request is None:
+                    break
+                response = await self.dispatch(request)
+                write_frame(writer, response)
+                await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            logger.debug("Conexão encerrada: %s", e)
+        finally:
+            writer.close()
+
+    async def dispatch(self, request):
+        request_id = request.get('id')
+        op = request.get('op')
+        args = request.get('args', [])
+        if op not in OPERATIONS:
+            return {'id': request_id, 'ok': False, 'error': f"Operação desconhecida: {op}"}
+
+        method = getattr(self.chat_server, op)
+        try:
+            if op in self.blocking_operations:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self.executor, method, *args)
+            else:
+                # Apenas estado em memória: heartbeat, remoção e, sem shards, a busca de vizinhos
+                result = method(*args)
+            return {'id': request_id, 'ok': True, 'result': result}
+        except Exception as e:
+            logger.error("Erro ao executar %s: %s", op, e)
+            return {'id': request_id, 'ok': False, 'error': str(e)}
+
+
+class AsyncChatConnection:
+    """Cliente do protocolo em quadros, usado por ferramentas e pelo gerador de carga"""
+
+    def __init__(self, host='localhost', port=9091):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.next_id = 0
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        return self
+
+    async def call(self, op, *args):
+        self.next_id += 1
+        write_frame(self.writer, {'id': self.next_id, 'op': op, 'args': list(args)})
+        await self.writer.drain()
+        response = await read_frame(self.reader)
+        if response is None:
+            raise ConnectionError("Conexão encerrada pelo servidor")
+        if not response['ok']:
+            raise Exception(response['error'])
+        return response['result']
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
@@ -0,0 +1,69 @@
+"""Benchmark do recálculo em massa das vizinhanças: uma thread x pool de 1 a N processos"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from spatial_grid import SpatialGrid, distance_meters
+from bulk_proximity import BulkProximityPool
+
+RADIUS = 200
+USERS = 20_000
+
+
+def generate_users(count):
+    # Mesma área usada por LoginWindow.generate_coordinates
+    return [
+        (f"user{i}", (random.uniform(-23.6, -23.5), random.uniform(-46.7, -46.6)))
+        for i in range(count)
+    ]
+
+
+def single_thread(users):
+    """Recálculo em massa em uma thread, com a grade espacial de ChatServer.find_nearby"""
+    grid = SpatialGrid(radius=RADIUS)
+    locations = dict(users)
+    for username, location in users:
+        grid.add(username, location)
+    result = {}
+    for username, location in users:
+        result[username] = [
+            (other, distance)
+            for other in grid.candidates(location)
+            if other != username
+            for distance in (distance_meters(location, locations[other]),)
+            if distance <= RADIUS
+        ]
+    return result
+
+
+def main():
+    random.seed(42)
+    users = generate_users(USERS)
+    max_workers = max(4, os.cpu_count() or 1)
+    print(f"{USERS} usuários, raio {RADIUS}m, {os.cpu_count()} CPUs disponíveis")
+
+    start = time.perf_counter()
+    expected = single_thread(users)
+    baseline = time.perf_counter() - start
+    pairs = sum(len(nearby) for nearby in expected.values())
+    print(f"{'processos':>10} {'tempo (s)':>10} {'ganho':>8}")
+    print(f"{'thread':>10} {baseline:>10.2f} {1.0:>7.1f}x   ({pairs} pares)")
+
+    workers = 1
+    while workers <= max_workers:
+        pool = BulkProximityPool(workers)
+        pool.neighbourhoods(users[:100], RADIUS)  # Aquecer: processos iniciados fora da medição
+        start = time.perf_counter()
+        result = pool.neighbourhoods(users, RADIUS)
+        elapsed = time.perf_counter() - start
+        pool.close()
+        assert sum(len(nearby) for nearby in result.values()) == pairs
+        print(f"{workers:>10} {elapsed:>10.2f} {baseline / elapsed:>7.1f}x")
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Gerador de carga: capacidade de conexões simultâneas e latência p99, Pyro x asyncio"""
+import asyncio
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+import Pyro4
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from async_server import AsyncChatServer, AsyncChatConnection
+from chat_server import ChatServer
+from fake_broker import FakeBroker
+
+REQUESTS_PER_CLIENT = 20
+CONCURRENCY = (50, 200, 500)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+
+def build_server(clients):
+    broker = FakeBroker()
+    server = ChatServer(connection_factory=broker.connection_factory,
+                        async_connection_factory=broker.async_connection_factory)
+    # Sem clientes reais: descartar os eventos de push em vez de tentar conectar
+    server.notifications.put = lambda item: None
+    for i in range(clients):
+        location = (random.uniform(-23.56, -23.54), random.uniform(-46.64, -46.62))
+        server.register_user(f"user{i}", location, f"PYRO:user{i}@localhost:0")
+    return server
+
+
+def run_pyro(server, clients):
+    daemon = Pyro4.Daemon()
+    uri = daemon.register(server)
+    threading.Thread(target=daemon.requestLoop, daemon=True).start()
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(clients)
+
+    def client(index):
+        local = []
+        try:
+            with Pyro4.Proxy(uri) as proxy:
+                proxy._pyroTimeout = 10
+                start_barrier.wait()
+                for i in range(REQUESTS_PER_CLIENT):
+                    start = time.perf_counter()
+                    if i % 2:
+                        proxy.get_nearby_users(f"user{index}")
+                    else:
+                        proxy.user_heartbeat(f"user{index}")
+                    local.append((time.perf_counter() - start) * 1000)
+        except Exception as e:
+            with lock:
+                errors.append(type(e).__name__)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    daemon.shutdown()
+    return latencies, errors
+
+
+def run_asyncio(server, clients):
+    front = AsyncChatServer(server, port=0)
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    def serve():
+        asyncio.set_event_loop(loop)
+        listener = loop.run_until_complete(front.start())
+        front.port = listener.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+
+    latencies, errors = [], []
+
+    async def client(index):
+        try:
+            connection = await AsyncChatConnection(port=front.port).connect()
+            for i in range(REQUESTS_PER_CLIENT):
+                start = time.perf_counter()
+                if i % 2:
+                    await connection.call('get_nearby_users', f"user{index}")
+                else:
+                    await connection.call('user_heartbeat', f"user{index}")
+                latencies.append((time.perf_counter() - start) * 1000)
+            await connection.close()
+        except Exception as e:
+            errors.append(type(e).__name__)
+
+    async def main():
+        await asyncio.gather(*(client(i) for i in range(clients)))
+
+    asyncio.run(main())
+
+    async def shutdown():
+        front.server.close()
+        await front.server.wait_closed()
+        # Deixa as conexões terminarem de processar o EOF dos clientes
+        await asyncio.sleep(0.2)
+
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    return latencies, errors
+
+
+def main():
+    logging.disable(logging.WARNING)
+    random.seed(5)
+    print(f"{'modo':<8} {'clientes':>8} {'ok':>6} {'erros':>6} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    for clients in CONCURRENCY:
+        for name, runner in (('pyro', run_pyro), ('asyncio', run_asyncio)):
+            server = build_server(clients)
+            latencies, errors = runner(server, clients)
+            completed = len(latencies) // REQUESTS_PER_CLIENT
+            print(f"{name:<8} {clients:>8} {completed:>6} {len(errors):>6} "
+                  f"{percentile(latencies, 0.5):>10.2f} {percentile(latencies, 0.99):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark de vazão de ChatServer.get_nearby_users com e sem log de depuração"""
+import contextlib
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from chat_server import ChatServer
+from fake_broker import FakeBroker
+
+USERS = 5_000
+CALLS = 2_000
+
+
+def build_server():
+    broker = FakeBroker()
+    server = ChatServer(connection_factory=broker.connection_factory,
+                        async_connection_factory=broker.async_connection_factory)
+    # Os URIs são fictícios: descartar os pushes em vez de tentar entregá-los
+    server.notifications.put = lambda item: None
+    for i in range(USERS):
+        location = (random.uniform(-23.6, -23.5), random.uniform(-46.7, -46.6))
+        server.register_user(f"user{i}", location, f"PYRO:user{i}@localhost:0")
+    return server
+
+
+def legacy_prints(server, username):
+    """Reproduz os prints que get_nearby_users fazia a cada chamada"""
+    print("Debug - Todos os usuários:", server.users)
+    for other, distance in server.find_nearby(username, server.users[username]['location']):
+        print(f"Debug - Calculando distância entre {username} e {other}: {distance:.2f}m")
+
+
+def measure(server, names, extra=None):
+    start = time.perf_counter()
+    for name in names:
+        if extra:
+            extra(server, name)
+        server.get_nearby_users(name)
+    return len(names) / (time.perf_counter() - start)
+
+
+def main():
+    random.seed(7)
+    logging.basicConfig(level=logging.WARNING)
+    server = build_server()
+    names = [f"user{random.randrange(USERS)}" for _ in range(CALLS)]
+    root = logging.getLogger()
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        # Todos os handlers escrevem em /dev/null para medir apenas o custo de formatação
+        streams = [(handler, handler.setStream(devnull)) for handler in root.handlers]
+        try:
+            legacy = measure(server, names[:200], legacy_prints)
+
+            root.setLevel(logging.DEBUG)
+            debug = measure(server, names)
+
+            root.setLevel(logging.WARNING)
+            quiet = measure(server, names)
+        finally:
+            # As threads do servidor continuam logando depois que /dev/null é fechado
+            for handler, stream in streams:
+                handler.setStream(stream)
+
+    print(f"prints por chamada (anterior): {legacy:>10.0f} chamadas/s")
+    print(f"logging em DEBUG:              {debug:>10.0f} chamadas/s")
+    print(f"logging desativado (WARNING):  {quiet:>10.0f} chamadas/s")
+    print(f"ganho sobre os prints: {quiet / legacy:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Benchmark do custo da instrumentação por chamada dos métodos do ChatServer"""
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from chat_server import ChatServer
+from fake_broker import FakeBroker
+
+CALLS = 200_000
+
+
+def uninstrumented_class():
+    """ChatServer com todos os métodos originais, sem nenhum wrapper de métricas"""
+    # functools.wraps guarda a função original em __wrapped__
+    namespace = {
+        name: getattr(value, '__wrapped__', value)
+        for name, value in vars(ChatServer).items()
+        if name not in ('__dict__', '__weakref__')
+    }
+    return type(ChatServer.__name__, ChatServer.__bases__, namespace)
+
+
+def build_server(cls, broker):
+    server = cls(connection_factory=broker.connection_factory,
+                 async_connection_factory=broker.async_connection_factory)
+    server.notifications.put = lambda item: None
+    server.register_user('origem', (-23.55, -46.63), 'PYRO:origem@localhost:0')
+    for i in range(20):
+        server.register_user(f"user{i}", (-23.55 + i * 0.0001, -46.63), f"PYRO:user{i}@localhost:0")
+    return server
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        func(*args)
+    return (time.perf_counter() - start) / CALLS * 1e6
+
+
+def main():
+    logging.disable(logging.WARNING)
+    broker = FakeBroker()
+    instrumented_server = build_server(ChatServer, broker)
+    raw_server = build_server(uninstrumented_class(), broker)
+
+    print(f"{'método':>18} {'sem métricas (µs)':>18} {'com métricas (µs)':>18} {'custo (µs)':>11}")
+    for name, args in (('user_heartbeat', ('origem',)), ('get_nearby_users', ('origem',))):
+        raw_us = measure(getattr(raw_server, name), *args)
+        instrumented_us = measure(getattr(instrumented_server, name), *args)
+        print(f"{name:>18} {raw_us:>18.2f} {instrumented_us:>18.2f} {instrumented_us - raw_us:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
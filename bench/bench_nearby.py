@@ -0,0 +1,74 @@
+"""Benchmark de latência da busca de usuários próximos: varredura completa x grade espacial"""
+import os
+import random
+import sys
+import time
+from math import sqrt, cos, radians
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from spatial_grid import SpatialGrid, METERS_PER_DEGREE
+
+RADIUS = 200
+QUERIES = 200
+
+
+def distance(loc1, loc2):
+    """Mesma fórmula de ChatServer.calculate_distance, sem os prints"""
+    lon_to_meters = METERS_PER_DEGREE * abs(cos(radians(loc1[0])))
+    lat_diff = (loc1[0] - loc2[0]) * METERS_PER_DEGREE
+    lon_diff = (loc1[1] - loc2[1]) * lon_to_meters
+    return sqrt(lat_diff**2 + lon_diff**2)
+
+
+def generate_users(count):
+    # Mesma área usada por LoginWindow.generate_coordinates
+    return {
+        f"user{i}": (random.uniform(-23.6, -23.5), random.uniform(-46.7, -46.6))
+        for i in range(count)
+    }
+
+
+def scan_nearby(users, username):
+    origin = users[username]
+    return [
+        other for other, location in users.items()
+        if other != username and distance(origin, location) <= RADIUS
+    ]
+
+
+def grid_nearby(users, grid, username):
+    origin = users[username]
+    return [
+        other for other in grid.candidates(origin)
+        if other != username and distance(origin, users[other]) <= RADIUS
+    ]
+
+
+def measure(func, names):
+    start = time.perf_counter()
+    for name in names:
+        func(name)
+    return (time.perf_counter() - start) / len(names) * 1000
+
+
+def main():
+    random.seed(42)
+    print(f"{'usuários':>10} {'varredura (ms)':>16} {'grade (ms)':>12} {'ganho':>8}")
+    for count in (1_000, 10_000, 100_000):
+        users = generate_users(count)
+        grid = SpatialGrid(radius=RADIUS)
+        for name, location in users.items():
+            grid.add(name, location)
+
+        names = random.sample(list(users), QUERIES)
+        for name in names[:20]:
+            assert sorted(scan_nearby(users, name)) == sorted(grid_nearby(users, grid, name))
+
+        scan_ms = measure(lambda n: scan_nearby(users, n), names)
+        grid_ms = measure(lambda n: grid_nearby(users, grid, n), names)
+        print(f"{count:>10} {scan_ms:>16.3f} {grid_ms:>12.3f} {scan_ms / grid_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Benchmark de get_offline_messages drenando 10k mensagens enfileiradas"""
+import json
+import logging
+import os
+import sys
+import time
+
+import pika
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from chat_server import ChatServer
+from fake_broker import FakeBroker
+
+MESSAGES = 10_000
+REFRESHES = 100
+LATENCY = 0.0001  # 0,1 ms por round-trip
+
+
+def build(far_ratio, legacy=False):
+    """Servidor com um destinatário, um remetente próximo e um distante"""
+    broker = FakeBroker(latency=LATENCY)
+    server = ChatServer(connection_factory=broker.connection_factory,
+                        async_connection_factory=broker.async_connection_factory)
+    if legacy:
+        # A fila por destinatário simula o servidor anterior: não migrá-la para o índice
+        server.offline_index.legacy = None
+    server.register_user('destino', (-23.55, -46.63), 'PYRO:destino@localhost:0')
+    server.register_user('perto', (-23.5501, -46.63), 'PYRO:perto@localhost:0')
+    server.register_user('longe', (-23.60, -46.63), 'PYRO:longe@localhost:0')
+    far_every = int(1 / far_ratio) if far_ratio else 0
+    senders = ['longe' if far_every and i % far_every == 0 else 'perto' for i in range(MESSAGES)]
+    return broker, server, senders
+
+
+def legacy_drain(server, channel, username):
+    """Laço anterior: um basic_get por mensagem, parando na primeira fora de alcance"""
+    queue_name = f'offline_messages.{username}'
+    messages = []
+    while True:
+        method_frame, _, body = channel.basic_get(queue=queue_name, auto_ack=False)
+        if not method_frame:
+            break
+        message_data = json.loads(body)
+        distance = server.calculate_distance(
+            server.users[message_data['sender']]['location'],
+            server.users[username]['location']
+        )
+        if distance <= 200:
+            messages.append(message_data)
+            channel.basic_ack(delivery_tag=method_frame.delivery_tag)
+        else:
+            channel.basic_reject(delivery_tag=method_frame.delivery_tag, requeue=True)
+            break
+    return messages
+
+
+def run_legacy(far_ratio):
+    broker, server, senders = build(far_ratio, legacy=True)
+    channel = broker.connection_factory().channel()
+    channel.queue_declare(queue='offline_messages.destino', durable=True)
+    for i, sender in enumerate(senders):
+        body = json.dumps({'sender': sender, 'recipient': 'destino', 'message': f"mensagem {i}"})
+        channel.basic_publish(exchange='', routing_key='offline_messages.destino', body=body,
+                              properties=pika.BasicProperties(delivery_mode=2))
+    return broker, lambda: legacy_drain(server, channel, 'destino')
+
+
+def run_indexed(far_ratio):
+    broker, server, senders = build(far_ratio)
+    for i, sender in enumerate(senders):
+        server.store_offline_message(sender, 'destino', f"mensagem {i}")
+    server.offline_publisher.flush()
+    while server.offline_index.count() < MESSAGES:
+        time.sleep(0.01)
+    return broker, lambda: server.get_offline_messages('destino')
+
+
+def measure(label, setup, far_ratio):
+    broker, drain = setup(far_ratio)
+    broker.round_trips = 0
+    start = time.perf_counter()
+    delivered = drain()
+    drain_ms = (time.perf_counter() - start) * 1000
+
+    # Atualizações seguintes, com apenas mensagens fora de alcance restantes
+    start = time.perf_counter()
+    for _ in range(REFRESHES):
+        drain()
+    refresh_ms = (time.perf_counter() - start) * 1000 / REFRESHES
+    print(f"{label:<22} dreno {drain_ms:>8.1f} ms  {len(delivered):>6} entregues  "
+          f"{broker.round_trips:>6} round-trips  atualização seguinte {refresh_ms:.3f} ms")
+
+
+def main():
+    # Usuários dos benchmarks não têm daemon Pyro: silenciar avisos de notificação
+    logging.disable(logging.WARNING)
+    for far_ratio in (0, 0.01):
+        print(f"\nmensagens de remetente distante: {far_ratio:.0%}")
+        measure("basic_get (anterior)", run_legacy, far_ratio)
+        measure("índice no servidor", run_indexed, far_ratio)
+
+
+if __name__ == "__main__":
+    main()
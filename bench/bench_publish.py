@@ -0,0 +1,78 @@
+"""Benchmark de vazão de store_offline_message: canal único com declare/bind por mensagem x publicador com confirms em lote"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import pika
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from chat_server import ChatServer
+from fake_broker import FakeBroker
+
+THREADS = 8
+MESSAGES_PER_THREAD = 500
+RECIPIENTS = 50
+LATENCY = 0.0002  # 0,2 ms por round-trip, semelhante a um broker local
+
+
+def legacy_store(channel, lock, sender, recipient, message):
+    """Caminho anterior: três round-trips em um canal compartilhado (serializado por lock)"""
+    queue_name = f'offline_messages.{recipient}'
+    with lock:
+        channel.queue_declare(queue=queue_name, durable=True)
+        channel.queue_bind(queue=queue_name, exchange='chat_exchange', routing_key=queue_name)
+        channel.basic_publish(
+            exchange='chat_exchange',
+            routing_key=queue_name,
+            body=json.dumps({'sender': sender, 'recipient': recipient, 'message': message}),
+            properties=pika.BasicProperties(delivery_mode=2, content_type='application/json')
+        )
+
+
+def run(store, finish=None):
+    def worker(index):
+        for i in range(MESSAGES_PER_THREAD):
+            store(f"sender{index}", f"user{i % RECIPIENTS}", f"mensagem {i}")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if finish:
+        finish()
+    return THREADS * MESSAGES_PER_THREAD / (time.perf_counter() - start)
+
+
+def main():
+    # Usuários dos benchmarks não têm daemon Pyro: silenciar avisos de notificação
+    logging.disable(logging.WARNING)
+    total = THREADS * MESSAGES_PER_THREAD
+
+    broker = FakeBroker(latency=LATENCY)
+    channel = broker.connection_factory().channel()
+    lock = threading.Lock()
+    broker.round_trips = 0
+    legacy = run(lambda *args: legacy_store(channel, lock, *args))
+    legacy_trips = broker.round_trips / total
+
+    broker = FakeBroker(latency=LATENCY)
+    server = ChatServer(connection_factory=broker.connection_factory,
+                        async_connection_factory=broker.async_connection_factory)
+    broker.round_trips = 0
+    # Inclui o tempo até a confirmação de todas as mensagens pelo publicador assíncrono
+    pooled = run(server.store_offline_message, server.offline_publisher.flush)
+    pooled_trips = broker.round_trips / total
+
+    print(f"canal único + declare/bind: {legacy:>9.0f} msg/s ({legacy_trips:.3f} round-trips/msg)")
+    print(f"confirms em lote:            {pooled:>8.0f} msg/s ({pooled_trips:.3f} round-trips/msg)")
+    print(f"ganho: {pooled / legacy:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
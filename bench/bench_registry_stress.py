@@ -0,0 +1,87 @@
+"""Stress multi-thread do registro de usuários: register/update/heartbeat/nearby concorrentes"""
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from chat_server import ChatServer
+from fake_broker import FakeBroker
+
+USERS = 2_000
+OPS_PER_THREAD = 5_000
+
+
+def random_location():
+    return (random.uniform(-23.56, -23.54), random.uniform(-46.64, -46.62))
+
+
+def worker(server, errors, seed):
+    rng = random.Random(seed)
+    for _ in range(OPS_PER_THREAD):
+        username = f"user{rng.randrange(USERS)}"
+        op = rng.random()
+        try:
+            if op < 0.05:
+                server.register_user(username, random_location(), f"PYRO:{username}@localhost:0")
+            elif op < 0.35:
+                server.update_location(username, random_location())
+            elif op < 0.55:
+                server.user_heartbeat(username)
+            elif op < 0.58:
+                server.remove_user(username)
+            else:
+                server.get_nearby_users(username)
+        except Exception as e:
+            errors.append(repr(e))
+
+
+def scanner(server, errors, stop):
+    """Faz o mesmo percurso do monitor de inatividade, continuamente"""
+    while not stop.is_set():
+        try:
+            sum(1 for _, data in server.users.items() if data['last_active'] > 0)
+        except Exception as e:
+            errors.append(repr(e))
+
+
+def run(threads):
+    broker = FakeBroker()
+    server = ChatServer(connection_factory=broker.connection_factory,
+                        async_connection_factory=broker.async_connection_factory)
+    # Sem clientes reais: descartar os eventos de push em vez de tentar conectar
+    server.notifications.put = lambda item: None
+    for i in range(USERS):
+        server.register_user(f"user{i}", random_location(), f"PYRO:user{i}@localhost:0")
+
+    errors = []
+    stop = threading.Event()
+    monitor = threading.Thread(target=scanner, args=(server, errors, stop))
+    monitor.start()
+    workers = [threading.Thread(target=worker, args=(server, errors, i)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    monitor.join()
+    return threads * OPS_PER_THREAD / elapsed, errors
+
+
+def main():
+    logging.disable(logging.WARNING)
+    random.seed(11)
+    for threads in (1, 2, 4, 8, 16):
+        ops, errors = run(threads)
+        print(f"{threads:>2} threads: {ops:>9.0f} ops/s  erros: {len(errors)}")
+        for error in sorted(set(errors))[:3]:
+            print(f"    {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark de latência de mensagens retransmitidas por ChatServer.send_message, com e sem pool de proxies"""
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import Pyro4
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from chat_server import ChatServer
+from fake_broker import FakeBroker
+
+SENDS = 2_000
+
+
+@Pyro4.expose
+class Receiver:
+    """Cliente mínimo: só aceita as chamadas que o servidor faz"""
+
+    def receive_message(self, sender, message):
+        return True
+
+    def proximity_changed(self, entered, left):
+        pass
+
+    def deliver_offline_messages(self, messages):
+        return True
+
+
+class NoPool:
+    """Comportamento anterior: um proxy novo (e uma conexão TCP) por mensagem"""
+
+    @contextmanager
+    def checkout(self, uri):
+        proxy = Pyro4.Proxy(uri)
+        try:
+            yield proxy
+        finally:
+            proxy._pyroRelease()
+
+    def evict(self, uri):
+        pass
+
+
+def measure(server):
+    latencies = []
+    for i in range(SENDS):
+        start = time.perf_counter()
+        server.send_message('a', 'b', f"mensagem {i}")
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99)]
+
+
+def main():
+    logging.disable(logging.WARNING)
+    daemon = Pyro4.Daemon()
+    uri = str(daemon.register(Receiver()))
+    threading.Thread(target=daemon.requestLoop, daemon=True).start()
+
+    broker = FakeBroker()
+    server = ChatServer(connection_factory=broker.connection_factory,
+                        async_connection_factory=broker.async_connection_factory)
+    server.register_user('a', (-23.55, -46.63), uri)
+    server.register_user('b', (-23.5501, -46.63), uri)
+    time.sleep(0.5)  # Deixa as notificações de proximidade serem enviadas
+
+    pooled = measure(server)
+    server.proxy_pool = NoPool()
+    unpooled = measure(server)
+
+    print(f"sem pool: p50 {unpooled[0]:.3f} ms  p99 {unpooled[1]:.3f} ms")
+    print(f"com pool: p50 {pooled[0]:.3f} ms  p99 {pooled[1]:.3f} ms")
+    daemon.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Benchmark do snapshot de presença: gravação periódica e restauração no boot"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from chat_server import ChatServer
+from fake_broker import FakeBroker
+from presence_snapshot import PresenceSnapshot
+
+
+def populate(server, count):
+    # Mesma área usada por LoginWindow.generate_coordinates
+    now = time.time()
+    for i in range(count):
+        server.users[f"user{i}"] = {
+            'location': (random.uniform(-23.6, -23.5), random.uniform(-46.7, -46.6)),
+            'last_active': now - random.uniform(0, 60),
+            'uri': f"PYRO:obj_{i:032x}@192.168.0.{i % 250}:{40000 + i % 20000}"
+        }
+
+
+def main():
+    logging.disable(logging.WARNING)
+    random.seed(42)
+    broker = FakeBroker(latency=0)
+    path = os.path.join(tempfile.mkdtemp(), 'chat.server.snapshot')
+
+    print(f"{'usuários':>10} {'gravar (ms)':>12} {'restaurar (ms)':>15} {'arquivo (KB)':>13}")
+    for count in (1_000, 10_000, 100_000):
+        source = ChatServer(connection_factory=broker.connection_factory,
+                            async_connection_factory=broker.async_connection_factory)
+        source.snapshot = PresenceSnapshot(path)
+        populate(source, count)
+        start = time.perf_counter()
+        source._save_snapshot()
+        save_ms = (time.perf_counter() - start) * 1000
+
+        # Servidor recém-iniciado: restaura registro, grade espacial e prazos
+        target = ChatServer(connection_factory=broker.connection_factory,
+                            async_connection_factory=broker.async_connection_factory)
+        target.snapshot = PresenceSnapshot(path)
+        start = time.perf_counter()
+        restored = target._restore_snapshot()
+        restore_ms = (time.perf_counter() - start) * 1000
+        assert restored == count
+
+        size_kb = os.path.getsize(path) / 1024
+        print(f"{count:>10} {save_ms:>12.1f} {restore_ms:>15.1f} {size_kb:>13.0f}")
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
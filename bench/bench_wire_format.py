@@ -0,0 +1,109 @@
+"""Benchmark do formato binário: tamanho e tempo de codificação de vizinhos e envelopes"""
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import serpent
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from wire_format import encode_nearby, decode_nearby, encode_envelope, decode_envelope
+
+NEIGHBOURS = 1000
+ROUNDS = 200
+
+
+def generate_neighbours(count):
+    # Mesmo formato das entradas de ChatServer.get_nearby_users
+    return [
+        {
+            'username': f"user{i}",
+            'location': (random.uniform(-23.6, -23.5), random.uniform(-46.7, -46.6)),
+            'distance': random.uniform(0, 200),
+            'uri': f"PYRO:obj_{uuid.uuid4().hex}@192.168.0.{i % 250}:{40000 + i}"
+        }
+        for i in range(count)
+    ]
+
+
+def generate_messages(count):
+    return [
+        {
+            'id': uuid.uuid4().hex,
+            'sender': f"user{random.randrange(1000)}",
+            'recipient': f"user{random.randrange(1000)}",
+            'message': "Olá! Estou chegando perto, me avise quando estiver livre.",
+            'timestamp': datetime.now().isoformat()
+        }
+        for _ in range(count)
+    ]
+
+
+def measure(func, rounds=ROUNDS):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def bench_nearby():
+    entries = generate_neighbours(NEIGHBOURS)
+    codecs = {
+        'json': (lambda: json.dumps(entries).encode('utf-8'), json.loads),
+        'serpent': (lambda: serpent.dumps(entries), serpent.loads),
+        'packed-v1': (lambda: encode_nearby(entries), decode_nearby),
+    }
+
+    print(f"Lista de {NEIGHBOURS} vizinhos")
+    print(f"{'formato':>10} {'bytes':>10} {'codificar (ms)':>16} {'decodificar (ms)':>18}")
+    for name, (encode, decode) in codecs.items():
+        payload = encode()
+        encode_ms = measure(encode)
+        decode_ms = measure(lambda: decode(payload))
+        print(f"{name:>10} {len(payload):>10} {encode_ms:>16.3f} {decode_ms:>18.3f}")
+
+
+def bench_envelopes():
+    messages = generate_messages(NEIGHBOURS)
+    json_bodies = [json.dumps(message).encode('utf-8') for message in messages]
+    binary_bodies = [encode_envelope(message) for message in messages]
+
+    def encode_json():
+        for message in messages:
+            json.dumps(message)
+
+    def encode_binary():
+        for message in messages:
+            encode_envelope(message)
+
+    def decode_json():
+        for body in json_bodies:
+            decode_envelope(body, 'application/json')
+
+    def decode_binary():
+        for body, content_type in binary_bodies:
+            decode_envelope(body, content_type)
+
+    print(f"\n{NEIGHBOURS} envelopes de mensagem offline")
+    print(f"{'formato':>10} {'bytes':>10} {'codificar (ms)':>16} {'decodificar (ms)':>18}")
+    rounds = ROUNDS // 10
+    json_size = sum(len(body) for body in json_bodies)
+    binary_size = sum(len(body) for body, _ in binary_bodies)
+    print(f"{'json':>10} {json_size:>10} {measure(encode_json, rounds):>16.3f} "
+          f"{measure(decode_json, rounds):>18.3f}")
+    print(f"{'binário':>10} {binary_size:>10} {measure(encode_binary, rounds):>16.3f} "
+          f"{measure(decode_binary, rounds):>18.3f}")
+
+
+def main():
+    random.seed(42)
+    bench_nearby()
+    bench_envelopes()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,353 @@
+"""Dublê em processo do RabbitMQ (subconjunto das APIs BlockingConnection e SelectConnection do pika)"""
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+import pika
+
+
+class FakeBroker:
+    """Estado compartilhado entre as conexões: exchanges, filas e bindings"""
+
+    def __init__(self, latency=0.0):
+        self.lock = threading.RLock()
+        self.exchanges = {}
+        self.queues = {}  # {nome: deque([(properties, body, redelivered)])}
+        self.bindings = {}  # {exchange: [(routing_key, fila)]}
+        self.latency = latency  # Atraso simulado por round-trip (segundos)
+        self.round_trips = 0
+
+    def round_trip(self):
+        with self.lock:
+            self.round_trips += 1
+        if self.latency:
+            threading.Event().wait(self.latency)
+
+    def connection_factory(self, parameters=None):
+        """Substituto de pika.BlockingConnection"""
+        return FakeConnection(self)
+
+    def async_connection_factory(self, parameters=None, on_open_callback=None,
+                                 on_open_error_callback=None, on_close_callback=None):
+        """Substituto de pika.SelectConnection"""
+        return FakeSelectConnection(self, on_open_callback, on_close_callback)
+
+    @staticmethod
+    def matches(pattern, routing_key):
+        pattern_parts = pattern.split('.')
+        key_parts = routing_key.split('.')
+        if '#' in pattern_parts:
+            prefix = pattern_parts[:pattern_parts.index('#')]
+            return key_parts[:len(prefix)] == prefix
+        if len(pattern_parts) != len(key_parts):
+            return False
+        return all(p in ('*', k) for p, k in zip(pattern_parts, key_parts))
+
+    def route(self, exchange, routing_key, properties, body):
+        with self.lock:
+            if not exchange:
+                targets = [routing_key] if routing_key in self.queues else []
+            else:
+                targets = {
+                    queue for pattern, queue in self.bindings.get(exchange, [])
+                    if self.matches(pattern, routing_key)
+                }
+            for queue in targets:
+                self.queues[queue].append((properties, body, False))
+            return bool(targets)
+
+
+class FakeConnection:
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_open = True
+        self.callbacks = deque()
+        self.channels = []
+
+    def channel(self):
+        self.broker.round_trip()
+        channel = FakeChannel(self)
+        self.channels.append(channel)
+        return channel
+
+    def add_callback_threadsafe(self, callback):
+        self.callbacks.append(callback)
+
+    def process_data_events(self, time_limit=0):
+        """Executa callbacks agendados e entrega mensagens aos consumidores"""
+        while self.callbacks:
+            self.callbacks.popleft()()
+        delivered = False
+        for channel in self.channels:
+            delivered = channel.dispatch() or delivered
+        if time_limit and not delivered:
+            threading.Event().wait(min(time_limit, 0.01))
+
+    def sleep(self, duration):
+        self.process_data_events(duration)
+
+    def close(self):
+        self.is_open = False
+
+
+class FakeChannel:
+    def __init__(self, connection):
+        self.connection = connection
+        self.broker = connection.broker
+        self.is_open = True
+        self.prefetch_count = 0
+        self.next_tag = 1
+        self.unacked = {}  # {delivery_tag: (fila, properties, body)}
+        self.consumers = {}  # {consumer_tag: (fila, callback)}
+        self.confirming = False
+
+    def basic_qos(self, prefetch_count=0, **kwargs):
+        self.broker.round_trip()
+        self.prefetch_count = prefetch_count
+
+    def confirm_delivery(self):
+        self.broker.round_trip()
+        self.confirming = True
+
+    def exchange_declare(self, exchange=None, exchange_type='direct', **kwargs):
+        self.broker.round_trip()
+        with self.broker.lock:
+            self.broker.exchanges.setdefault(exchange, exchange_type)
+
+    def queue_declare(self, queue='', passive=False, **kwargs):
+        self.broker.round_trip()
+        with self.broker.lock:
+            if passive and queue not in self.broker.queues:
+                # Como o RabbitMQ: 404 e o canal é fechado
+                self.is_open = False
+                raise pika.exceptions.ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{queue}'")
+            messages = self.broker.queues.setdefault(queue, deque())
+            return SimpleNamespace(method=SimpleNamespace(queue=queue, message_count=len(messages)))
+
+    def queue_bind(self, queue, exchange, routing_key=None, **kwargs):
+        self.broker.round_trip()
+        with self.broker.lock:
+            bindings = self.broker.bindings.setdefault(exchange, [])
+            if (routing_key, queue) not in bindings:
+                bindings.append((routing_key, queue))
+
+    def queue_delete(self, queue, **kwargs):
+        self.broker.round_trip()
+        with self.broker.lock:
+            self.broker.queues.pop(queue, None)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self.broker.round_trip()
+        routed = self.broker.route(exchange, routing_key, properties, body)
+        if mandatory and not routed and self.confirming:
+            raise pika.exceptions.UnroutableError([])
+
+    def _deliver(self, queue):
+        with self.broker.lock:
+            messages = self.broker.queues.get(queue)
+            if not messages:
+                return None
+            properties, body, redelivered = messages.popleft()
+            tag = self.next_tag
+            self.next_tag += 1
+            self.unacked[tag] = (queue, properties, body)
+        method = SimpleNamespace(delivery_tag=tag, redelivered=redelivered, routing_key=queue)
+        return method, properties, body
+
+    def basic_get(self, queue, auto_ack=False):
+        self.broker.round_trip()
+        delivery = self._deliver(queue)
+        if delivery is None:
+            return None, None, None
+        if auto_ack:
+            self.unacked.pop(delivery[0].delivery_tag, None)
+        return delivery
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        for tag in self._tags(delivery_tag, multiple):
+            self.unacked.pop(tag, None)
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        # Em ordem decrescente para que appendleft preserve a ordem original
+        for tag in reversed(self._tags(delivery_tag, multiple)):
+            queue, properties, body = self.unacked.pop(tag)
+            if requeue:
+                with self.broker.lock:
+                    self.broker.queues[queue].appendleft((properties, body, True))
+
+    def basic_reject(self, delivery_tag, requeue=True):
+        self.basic_nack(delivery_tag, requeue=requeue)
+
+    def _tags(self, delivery_tag, multiple):
+        if multiple:
+            return sorted(tag for tag in self.unacked if tag <= delivery_tag)
+        return [delivery_tag] if delivery_tag in self.unacked else []
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False, **kwargs):
+        self.broker.round_trip()
+        tag = f"ctag{len(self.consumers) + 1}"
+        self.consumers[tag] = (queue, on_message_callback)
+        return tag
+
+    def dispatch(self):
+        delivered = False
+        for queue, callback in list(self.consumers.values()):
+            while self.is_open:
+                if self.prefetch_count and len(self.unacked) >= self.prefetch_count:
+                    return delivered
+                delivery = self._deliver(queue)
+                if delivery is None:
+                    break
+                delivered = True
+                callback(self, *delivery)
+        return delivered
+
+    def close(self):
+        self.is_open = False
+
+
+class FakeIOLoop:
+    """Laço de eventos mínimo: callbacks thread-safe e temporizadores"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.callbacks = deque()
+        self.timers = []  # [(instante, sequência, callback)]
+        self.sequence = itertools.count()
+        self.running = False
+
+    def add_callback_threadsafe(self, callback):
+        with self.condition:
+            self.callbacks.append(callback)
+            self.condition.notify()
+
+    def call_later(self, delay, callback):
+        with self.condition:
+            heapq.heappush(self.timers, (time.monotonic() + delay, next(self.sequence), callback))
+            self.condition.notify()
+
+    def start(self):
+        self.running = True
+        while self.running:
+            with self.condition:
+                now = time.monotonic()
+                while self.timers and self.timers[0][0] <= now:
+                    self.callbacks.append(heapq.heappop(self.timers)[2])
+                if not self.callbacks:
+                    timeout = self.timers[0][0] - now if self.timers else None
+                    self.condition.wait(timeout)
+                    continue
+                callback = self.callbacks.popleft()
+            callback()
+
+    def stop(self):
+        self.running = False
+
+
+class FakeSelectConnection:
+    def __init__(self, broker, on_open_callback, on_close_callback):
+        self.broker = broker
+        self.ioloop = FakeIOLoop()
+        self.is_open = True
+        self.on_close_callback = on_close_callback
+        if on_open_callback:
+            self.ioloop.add_callback_threadsafe(lambda: on_open_callback(self))
+
+    def channel(self, on_open_callback=None):
+        channel = FakeAsyncChannel(self)
+        self.ioloop.add_callback_threadsafe(lambda: on_open_callback(channel))
+        return channel
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        if self.on_close_callback:
+            self.ioloop.add_callback_threadsafe(
+                lambda: self.on_close_callback(self, Exception("Conexão fechada"))
+            )
+
+
+class FakeAsyncChannel:
+    """Canal assíncrono: publicações não esperam o broker e os acks chegam agrupados"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.broker = connection.broker
+        self.ioloop = connection.ioloop
+        self.is_open = True
+        self.next_tag = 0
+        self.unconfirmed = []  # Delivery tags ainda sem ack
+        self.returns = []  # Mensagens sem rota a devolver antes do ack
+        self.ack_scheduled = False
+        self.on_ack_nack = None
+        self.on_return = None
+        self.close_callbacks = []
+
+    def _reply(self, callback, frame=None):
+        if callback:
+            # Cada operação síncrona do protocolo custa um round-trip
+            with self.broker.lock:
+                self.broker.round_trips += 1
+            self.ioloop.call_later(self.broker.latency, lambda: callback(frame))
+
+    def add_on_close_callback(self, callback):
+        self.close_callbacks.append(callback)
+
+    def add_on_return_callback(self, callback):
+        self.on_return = callback
+
+    def confirm_delivery(self, ack_nack_callback, callback=None):
+        self.on_ack_nack = ack_nack_callback
+        self._reply(callback)
+
+    def queue_declare(self, queue, durable=False, callback=None, **kwargs):
+        with self.broker.lock:
+            self.broker.queues.setdefault(queue, deque())
+        self._reply(callback)
+
+    def queue_bind(self, queue, exchange, routing_key=None, callback=None, **kwargs):
+        with self.broker.lock:
+            bindings = self.broker.bindings.setdefault(exchange, [])
+            if (routing_key, queue) not in bindings:
+                bindings.append((routing_key, queue))
+        self._reply(callback)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        if not self.is_open:
+            raise pika.exceptions.ChannelWrongStateError("Canal fechado")
+        routed = self.broker.route(exchange, routing_key, properties, body)
+        if mandatory and not routed:
+            method = SimpleNamespace(reply_code=312, reply_text='NO_ROUTE',
+                                     exchange=exchange, routing_key=routing_key)
+            self.returns.append((method, properties, body))
+        if self.on_ack_nack is None:
+            return
+        self.next_tag += 1
+        self.unconfirmed.append(self.next_tag)
+        if not self.ack_scheduled:
+            # Tudo o que for publicado até a resposta chegar é confirmado por um único ack
+            self.ack_scheduled = True
+            with self.broker.lock:
+                self.broker.round_trips += 1
+            self.ioloop.call_later(self.broker.latency, self._send_acks)
+
+    def _send_acks(self):
+        self.ack_scheduled = False
+        if not self.is_open or not self.unconfirmed:
+            return
+        returns, self.returns = self.returns, []
+        for method, properties, body in returns:
+            if self.on_return:
+                self.on_return(self, method, properties, body)
+        last = self.unconfirmed[-1]
+        self.unconfirmed = []
+        self.on_ack_nack(SimpleNamespace(method=pika.spec.Basic.Ack(delivery_tag=last, multiple=True)))
+
+    def close(self):
+        self.is_open = False
+        for callback in self.close_callbacks:
+            self.ioloop.add_callback_threadsafe(lambda callback=callback: callback(self, Exception("Canal fechado")))
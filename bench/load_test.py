@@ -0,0 +1,287 @@
+"""Teste de carga: milhares de agentes sem interface contra um ChatServer local.
+
+Sobe um name server Pyro e o ChatServer (com o dublê do RabbitMQ) no mesmo
+processo; cada agente se registra como um ChatClient, se move segundo o modelo
+escolhido, consulta vizinhos, envia mensagens e busca as offline. Ao final mostra
+a vazão e as latências p50/p95/p99 por operação; --json grava o resultado para
+comparar versões.
+
+Uso: python bench/load_test.py --agents 2000 --duration 30 --movement random_walk
+"""
+import argparse
+import heapq
+import json
+import logging
+import math
+import os
+import random
+import sys
+import threading
+import time
+
+import Pyro4
+import Pyro4.naming
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from chat_server import ChatServer
+from fake_broker import FakeBroker
+from spatial_grid import METERS_PER_DEGREE
+
+OPERATIONS = ('get_nearby_users', 'send_message', 'store_offline_message', 'get_offline_messages')
+
+# Mesma área usada por LoginWindow.generate_coordinates
+AREA = ((-23.6, -23.5), (-46.7, -46.6))
+
+
+def random_location():
+    return (random.uniform(*AREA[0]), random.uniform(*AREA[1]))
+
+
+def offset(location, meters, bearing):
+    """Desloca a localização em metros na direção indicada (radianos)"""
+    lat, lon = location
+    lat += meters * math.cos(bearing) / METERS_PER_DEGREE
+    lon += meters * math.sin(bearing) / (METERS_PER_DEGREE * abs(math.cos(math.radians(lat))))
+    return (lat, lon)
+
+
+# Modelos de movimento: recebem o agente e o tempo decorrido e retornam a nova posição
+def move_static(agent, elapsed):
+    return None
+
+
+def move_random_walk(agent, elapsed):
+    return offset(agent.location, agent.speed * elapsed, random.uniform(0, 2 * math.pi))
+
+
+def move_commute(agent, elapsed):
+    """Segue em linha reta até um destino e então sorteia outro"""
+    if agent.target is None:
+        agent.target = random_location()
+    lat_diff = (agent.target[0] - agent.location[0]) * METERS_PER_DEGREE
+    lon_diff = ((agent.target[1] - agent.location[1])
+                * METERS_PER_DEGREE * abs(math.cos(math.radians(agent.location[0]))))
+    remaining = math.hypot(lat_diff, lon_diff)
+    step = agent.speed * elapsed
+    if remaining <= step:
+        location, agent.target = agent.target, None
+        return location
+    return offset(agent.location, step, math.atan2(lon_diff, lat_diff))
+
+
+MOVEMENT_MODELS = {
+    'static': move_static,
+    'random_walk': move_random_walk,
+    'commute': move_commute,
+}
+
+
+@Pyro4.expose
+class HeadlessAgent:
+    """Equivalente ao ChatClient sem Tk: apenas os callbacks chamados pelo servidor"""
+
+    def __init__(self, username, location, speed):
+        self.username = username
+        self.location = location
+        self.speed = speed  # Metros por segundo
+        self.target = None
+        self.nearby = []
+        self.received = 0
+        self.uri = None
+
+    def receive_message(self, sender, message):
+        self.received += 1
+        return True
+
+    def proximity_changed(self, entered, left):
+        pass
+
+    def deliver_offline_messages(self, messages):
+        self.received += len(messages)
+        return True
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.movement = MOVEMENT_MODELS[args.movement]
+        self.latencies = {op: [] for op in OPERATIONS + ('update_location',)}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def start_infrastructure(self):
+        # Name server local em porta livre
+        ns_uri, ns_daemon, _ = Pyro4.naming.startNS(host='localhost', port=0)
+        threading.Thread(target=ns_daemon.requestLoop, daemon=True).start()
+        self.ns_daemon = ns_daemon
+
+        broker = FakeBroker(latency=self.args.broker_latency)
+        self.server = ChatServer(connection_factory=broker.connection_factory,
+                                 async_connection_factory=broker.async_connection_factory)
+        self.server_daemon = Pyro4.Daemon(host='localhost')
+        uri = self.server_daemon.register(self.server)
+        Pyro4.Proxy(ns_uri).register('chat.server', uri)
+        threading.Thread(target=self.server_daemon.requestLoop, daemon=True).start()
+        self.server_name = f"PYRONAME:chat.server@localhost:{ns_uri.port}"
+
+        # Um daemon compartilhado hospeda os callbacks de todos os agentes
+        self.agent_daemon = Pyro4.Daemon(host='localhost')
+        threading.Thread(target=self.agent_daemon.requestLoop, daemon=True).start()
+
+    def create_agents(self):
+        self.agents = []
+        with Pyro4.Proxy(self.server_name) as server:
+            for i in range(self.args.agents):
+                agent = HeadlessAgent(f"agent{i}", random_location(), self.args.speed)
+                agent.uri = str(self.agent_daemon.register(agent))
+                server.register_user(agent.username, agent.location, agent.uri)
+                self.agents.append(agent)
+
+    def timed(self, samples, op, call, *args):
+        start = time.perf_counter()
+        try:
+            result = call(*args)
+        except Exception as e:
+            with self.lock:
+                self.errors[op] = self.errors.get(op, 0) + 1
+            logging.getLogger(__name__).debug("Erro em %s: %s", op, e)
+            return None
+        samples[op].append(time.perf_counter() - start)
+        return result
+
+    def turn(self, server, agent, samples, elapsed):
+        """Uma rodada do agente: mover, consultar vizinhos e talvez enviar mensagens"""
+        new_location = self.movement(agent, elapsed)
+        if new_location is not None:
+            agent.location = new_location
+            self.timed(samples, 'update_location', server.update_location, agent.username, new_location)
+
+        nearby = self.timed(samples, 'get_nearby_users', server.get_nearby_users, agent.username)
+        if nearby is not None:
+            agent.nearby = nearby
+
+        if random.random() < self.args.message_rate * self.args.interval:
+            if agent.nearby and random.random() >= self.args.offline_ratio:
+                recipient = random.choice(agent.nearby)['username']
+                self.timed(samples, 'send_message', server.send_message,
+                           agent.username, recipient, "mensagem de carga")
+            else:
+                recipient = random.choice(self.agents).username
+                self.timed(samples, 'store_offline_message', server.store_offline_message,
+                           agent.username, recipient, "mensagem de carga")
+
+        if random.random() < self.args.interval / self.args.offline_interval:
+            self.timed(samples, 'get_offline_messages', server.get_offline_messages, agent.username)
+
+    def worker(self, agents, deadline):
+        """Agenda as rodadas dos agentes do worker pelo próximo instante devido"""
+        samples = {op: [] for op in self.latencies}
+        now = time.time()
+        # Espalhar as primeiras rodadas para não sincronizar todos os agentes
+        schedule = [(now + random.uniform(0, self.args.interval), i) for i in range(len(agents))]
+        heapq.heapify(schedule)
+        last_turn = {}
+        with Pyro4.Proxy(self.server_name) as server:
+            server._pyroTimeout = 30
+            while schedule:
+                due, index = heapq.heappop(schedule)
+                if due >= deadline:
+                    break
+                delay = due - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                now = time.time()
+                elapsed = now - last_turn.get(index, now - self.args.interval)
+                last_turn[index] = now
+                self.turn(server, agents[index], samples, elapsed)
+                heapq.heappush(schedule, (max(due + self.args.interval, now), index))
+
+        with self.lock:
+            for op, values in samples.items():
+                self.latencies[op].extend(values)
+
+    def run(self):
+        self.start_infrastructure()
+        start = time.perf_counter()
+        self.create_agents()
+        print(f"{len(self.agents)} agentes registrados em {time.perf_counter() - start:.1f}s "
+              f"(movimento: {self.args.movement})")
+
+        deadline = time.time() + self.args.duration
+        groups = [self.agents[i::self.args.workers] for i in range(self.args.workers)]
+        threads = [threading.Thread(target=self.worker, args=(group, deadline)) for group in groups if group]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - start
+
+        self.server_daemon.shutdown()
+        self.agent_daemon.shutdown()
+        self.ns_daemon.shutdown()
+        return self.report()
+
+    def report(self):
+        results = {}
+        print(f"\n{'operação':>24} {'chamadas':>9} {'vazão (/s)':>11} "
+              f"{'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'erros':>6}")
+        for op, values in self.latencies.items():
+            values.sort()
+            stats = {
+                'calls': len(values),
+                'throughput': len(values) / self.elapsed,
+                'p50_ms': percentile(values, 0.50) * 1000,
+                'p95_ms': percentile(values, 0.95) * 1000,
+                'p99_ms': percentile(values, 0.99) * 1000,
+                'errors': self.errors.get(op, 0),
+            }
+            results[op] = stats
+            print(f"{op:>24} {stats['calls']:>9} {stats['throughput']:>11.1f} {stats['p50_ms']:>9.2f} "
+                  f"{stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f} {stats['errors']:>6}")
+        return results
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--agents', type=int, default=1000, help="número de agentes")
+    parser.add_argument('--duration', type=float, default=20, help="duração da medição (s)")
+    parser.add_argument('--workers', type=int, default=32, help="threads que conduzem os agentes")
+    parser.add_argument('--interval', type=float, default=5.0, help="intervalo entre rodadas de cada agente (s)")
+    parser.add_argument('--movement', choices=sorted(MOVEMENT_MODELS), default='random_walk')
+    parser.add_argument('--speed', type=float, default=1.4, help="velocidade dos agentes (m/s)")
+    parser.add_argument('--message-rate', type=float, default=0.05,
+                        help="mensagens por agente por segundo")
+    parser.add_argument('--offline-ratio', type=float, default=0.3,
+                        help="fração das mensagens enviadas a destinatários fora de alcance")
+    parser.add_argument('--offline-interval', type=float, default=30.0,
+                        help="intervalo médio entre buscas de mensagens offline (s)")
+    parser.add_argument('--broker-latency', type=float, default=0.0002,
+                        help="latência simulada por round-trip ao broker (s)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="grava o resultado neste arquivo")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=os.environ.get("CHAT_LOG_LEVEL", "ERROR").upper())
+    random.seed(args.seed)
+    # Muitas conexões simultâneas: ampliar o pool de threads dos daemons Pyro
+    Pyro4.config.THREADPOOL_SIZE = max(Pyro4.config.THREADPOOL_SIZE, 4 * args.workers)
+
+    results = LoadTest(args).run()
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'args': vars(args), 'results': results}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
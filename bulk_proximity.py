@@ -0,0 +1,144 @@
+import logging
+import multiprocessing
+import os
+from array import array
+from math import sqrt, cos, radians, floor
+from multiprocessing import shared_memory
+
+from spatial_grid import METERS_PER_DEGREE
+
+logger = logging.getLogger(__name__)
+
+# Estado de cada processo do pool: o último bloco de memória compartilhada anexado
+_attached = None  # (nome, SharedMemory, {célula: (início, fim)})
+
+
+def _cell(lat, lon, cell_size):
+    return (floor(lat / cell_size), floor(lon / cell_size))
+
+
+def _attach(name, count, cell_size):
+    """Anexa o bloco de coordenadas e monta o índice de células (ordenadas por célula)"""
+    global _attached
+    if _attached is not None and _attached[0] == name:
+        return _attached
+    if _attached is not None:
+        _attached[1].close()
+
+    shm = shared_memory.SharedMemory(name=name)
+    cells = {}
+    with shm.buf.cast('d') as coords:
+        for i in range(count):
+            cell = _cell(coords[2 * i], coords[2 * i + 1], cell_size)
+            bounds = cells.get(cell)
+            cells[cell] = (bounds[0], i + 1) if bounds else (i, i + 1)
+    _attached = (name, shm, cells)
+    return _attached
+
+
+def _neighbourhoods_task(task):
+    """Calcula os vizinhos das posições [start, end) varrendo as células adjacentes"""
+    name, count, radius, start, end = task
+    cell_size = radius / METERS_PER_DEGREE
+    _, shm, cells = _attach(name, count, cell_size)
+    # A view é liberada ao fim da tarefa para que o bloco possa ser fechado depois
+    with shm.buf.cast('d') as coords:  # lat0, lon0, lat1, lon1, ...
+        return _scan(coords, cells, cell_size, radius, start, end)
+
+
+def _scan(coords, cells, cell_size, radius, start, end):
+    """Retorna arrays paralelos (origem, vizinho, distância) com índices das posições"""
+    origins = array('l')
+    others = array('l')
+    distances = array('d')
+    lat_span = radius / METERS_PER_DEGREE
+    for i in range(start, end):
+        lat = coords[2 * i]
+        lon = coords[2 * i + 1]
+        # Mesma aproximação de ChatServer.calculate_distance (escala pela latitude de origem)
+        lon_to_meters = METERS_PER_DEGREE * abs(cos(radians(lat)))
+        if lon_to_meters < 1e-6:
+            ranges = cells.values()
+        else:
+            lon_span = radius / lon_to_meters
+            min_row, min_col = _cell(lat - lat_span, lon - lon_span, cell_size)
+            max_row, max_col = _cell(lat + lat_span, lon + lon_span, cell_size)
+            ranges = [
+                cells[(row, col)]
+                for row in range(min_row, max_row + 1)
+                for col in range(min_col, max_col + 1)
+                if (row, col) in cells
+            ]
+        for first, last in ranges:
+            for j in range(first, last):
+                if j == i:
+                    continue
+                lat_diff = (lat - coords[2 * j]) * METERS_PER_DEGREE
+                lon_diff = (lon - coords[2 * j + 1]) * lon_to_meters
+                distance = sqrt(lat_diff * lat_diff + lon_diff * lon_diff)
+                if distance <= radius:
+                    origins.append(i)
+                    others.append(j)
+                    distances.append(distance)
+    return origins, others, distances
+
+
+class BulkProximityPool:
+    """Recalcula a vizinhança de toda a população em um pool de processos.
+
+    As coordenadas vão para um bloco de memória compartilhada ordenado por célula da
+    grade; cada tarefa recebe apenas um intervalo de posições, nunca o dicionário de
+    usuários. Usado em operações em massa (reinício, importação, varredura de push).
+    """
+
+    def __init__(self, workers=None, tasks_per_worker=4):
+        self.workers = workers or os.cpu_count() or 1
+        self.tasks_per_worker = tasks_per_worker
+        # spawn: o servidor tem threads ativas, e fork copiaria locks em estado indefinido
+        self.pool = multiprocessing.get_context('spawn').Pool(self.workers)
+
+    def _partition(self, cells, task_count):
+        """Divide as posições em intervalos que não cortam células"""
+        target = max(1, len(cells) // task_count)
+        tasks = []
+        start = 0
+        for i in range(1, len(cells) + 1):
+            if i == len(cells) or (i - start >= target and cells[i] != cells[i - 1]):
+                tasks.append((start, i))
+                start = i
+        return tasks
+
+    def neighbourhoods(self, users, radius=200):
+        """Recebe [(username, localização)] e retorna {username: [(vizinho, distância)]}"""
+        cell_size = radius / METERS_PER_DEGREE
+        entries = sorted(
+            (_cell(location[0], location[1], cell_size), username, location)
+            for username, location in users
+        )
+        names = [username for _, username, _ in entries]
+        result = {username: [] for username in names}
+        if not entries:
+            return result
+
+        shm = shared_memory.SharedMemory(create=True, size=16 * len(entries))
+        try:
+            with shm.buf.cast('d') as coords:
+                for i, (_, _, location) in enumerate(entries):
+                    coords[2 * i] = location[0]
+                    coords[2 * i + 1] = location[1]
+
+            ranges = self._partition([cell for cell, _, _ in entries],
+                                     self.workers * self.tasks_per_worker)
+            tasks = [(shm.name, len(entries), radius, start, end) for start, end in ranges]
+            for origins, others, distances in self.pool.imap_unordered(_neighbourhoods_task, tasks):
+                for i, j, distance in zip(origins, others, distances):
+                    result[names[i]].append((names[j], distance))
+        finally:
+            shm.close()
+            shm.unlink()
+        logger.debug("Vizinhança de %d usuários recalculada em %d tarefas", len(names), len(tasks))
+        return result
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
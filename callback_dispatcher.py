@@ -0,0 +1,77 @@
+import threading
+import queue
+import logging
+from collections import deque
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CallbackDispatcher:
+    """Entrega chamadas aos callbacks Pyro dos clientes em um pequeno pool de threads.
+
+    Cada URI tem sua própria fila, atendida por uma thread de cada vez (a ordem dos
+    eventos de um cliente é mantida). Um cliente inacessível ocupa apenas uma thread
+    até o timeout do proxy, e os demais eventos pendentes dele falham sem nova espera.
+    """
+
+    def __init__(self, proxy_pool, workers=8):
+        self.proxy_pool = proxy_pool
+        self.queues = {}  # {uri: deque([(método, argumentos, ao_falhar)])}
+        self.ready = queue.Queue()  # URIs com eventos pendentes e nenhuma thread atendendo
+        self.lock = threading.Lock()
+        for _ in range(workers):
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+
+    def put(self, item):
+        """Enfileira (uri, método, argumentos, ao_falhar) para o callback do cliente"""
+        uri, method, args, on_failure = item
+        with self.lock:
+            pending = self.queues.get(uri)
+            if pending is not None:
+                # Já há uma thread atendendo (ou a caminho de atender) este URI
+                pending.append((method, args, on_failure))
+                return
+            self.queues[uri] = deque([(method, args, on_failure)])
+        self.ready.put(uri)
+
+    def _run(self):
+        while True:
+            uri = self.ready.get()
+            with self.lock:
+                method, args, on_failure = self.queues[uri].popleft()
+            if self._call(uri, method, args, on_failure):
+                with self.lock:
+                    if self.queues[uri]:
+                        # Volta ao fim da fila para não monopolizar a thread
+                        self.ready.put(uri)
+                    else:
+                        del self.queues[uri]
+            else:
+                # Os eventos restantes esperariam o mesmo timeout: falham de imediato
+                with self.lock:
+                    failed = self.queues.pop(uri)
+                for method, args, on_failure in failed:
+                    self._failed(uri, method, on_failure)
+
+    def _call(self, uri, method, args, on_failure):
+        try:
+            with metrics.histogram('chat_server_callback_seconds', method=method).time():
+                with self.proxy_pool.checkout(uri) as proxy:
+                    getattr(proxy, method)(*args)
+            return True
+        except Exception as e:
+            logger.warning("Erro ao chamar %s em %s: %s", method, uri, e)
+            self._failed(uri, method, on_failure)
+            return False
+
+    def _failed(self, uri, method, on_failure):
+        metrics.counter('chat_server_callback_errors_total', method=method).inc()
+        if on_failure:
+            try:
+                on_failure()
+            except Exception as e:
+                logger.error("Erro ao tratar falha de %s em %s: %s", method, uri, e)
@@ -1,34 +1,71 @@
 import Pyro4
+import serpent
 import pika
 import json
 import threading
 import time
 import random
 import sys
+import os
+import logging
 from datetime import datetime
 from login_gui import LoginWindow
 from chat_gui import ChatWindow
+from spatial_grid import SpatialGrid, distance_meters
+from shard_map import ShardMap
+from wire_format import decode_nearby
+from offline_inbox import OfflineInbox, inbox_file
+
+logger = logging.getLogger(__name__)
 
 @Pyro4.expose
 class ChatClient:
-    def __init__(self, username, initial_location):
+    def __init__(self, username, initial_location, min_displacement=10, debounce=2.0, inbox_path=None):
         self.username = username
         self.location = tuple(float(x) for x in initial_location)  # Garantir que são floats
-        self.server = Pyro4.Proxy("PYRONAME:chat.server")
+        
+        # Filtro para feeds contínuos de GPS (feed_location)
+        self.min_displacement = min_displacement  # Metros abaixo dos quais a posição não é enviada
+        self.debounce = debounce  # Janela (segundos) para agrupar rajadas de posições
+        self.reported_location = self.location
+        self.movement_grid = SpatialGrid(radius=200)  # Mesmas células do servidor
+        self.pending_location = None
+        self.location_timer = None
+        self.location_lock = threading.Lock()
+        # Roteamento: cada região é atendida por um shard registrado como chat.server.<n>
+        self.shard_map = ShardMap.from_env()
+        self.shard = self.shard_map.shard_for(self.location)
+        self.server = Pyro4.Proxy(self.shard_map.uri(self.shard))
         self.nearby_users = []
         self.user_proxies = {}  # {username: proxy}
+        # Pushes, report() do heartbeat e o refresh periódico atualizam a lista em threads distintas
+        self.nearby_lock = threading.Lock()
+        self.report_version = None  # Versão da última lista recebida por report()
+        
+        # Mensagens offline já baixadas, guardadas até o remetente entrar no alcance
+        if inbox_path is None:
+            inbox_dir = os.environ.get("CHAT_INBOX_DIR", os.path.join(os.path.expanduser("~"), ".chat_client"))
+            inbox_path = inbox_file(inbox_dir, username)
+        self.inbox = OfflineInbox(inbox_path)
         
-        print(f"Debug - Iniciando cliente com localização: {self.location}")
+        logger.debug("Iniciando cliente com localização: %s", self.location)
+        
+        # Negociar o formato da lista de vizinhos; servidores antigos só têm a lista de dicts
+        try:
+            formats = self.server.get_wire_formats()
+        except Exception:
+            formats = []
+        self.wire_format = 'packed-v1' if 'packed-v1' in formats else 'dicts'
         
         # Registrar no servidor
         try:
             self.daemon = Pyro4.Daemon()
             self.uri = self.daemon.register(self)
-            success = self.server.register_user(username, self.location, str(self.uri))
+            success = self.server.register_user(username, self.location, str(self.uri), *self._format_args())
             if not success:
                 raise Exception("Falha ao registrar usuário")
         except Exception as e:
-            print(f"Erro ao registrar cliente: {e}")
+            logger.error("Erro ao registrar cliente: %s", e)
             raise e
         
         # Iniciar thread para receber chamadas remotas
@@ -46,7 +83,7 @@ class ChatClient:
         self.heartbeat_thread.daemon = True
         self.heartbeat_thread.start()
         
-        print(f"Cliente {username} iniciado na posição {initial_location}")
+        logger.info("Cliente %s iniciado na posição %s", username, initial_location)
         
         # Verificar mensagens offline ao iniciar
         self.check_offline_messages()
@@ -60,7 +97,7 @@ class ChatClient:
             if not sender_nearby:
                 # Se não estiver próximo, a mensagem deve ir para a fila MOM
                 success, msg = self.server.send_message(sender, self.username, message)
-                print(f"Mensagem de {sender} armazenada para entrega posterior")
+                logger.info("Mensagem de %s armazenada para entrega posterior", sender)
                 return True
             
             # Se estiver próximo, mostrar na interface
@@ -73,65 +110,192 @@ class ChatClient:
                 return True
             
         except Exception as e:
-            print(f"Erro ao receber mensagem: {e}")
+            logger.error("Erro ao receber mensagem: %s", e)
             return False
     
     def update_location(self, new_location):
         """Atualiza a localização do usuário"""
         try:
             self.location = new_location
-            success = self.server.update_location(self.username, new_location)
+            self.route(new_location)
+            # Uma única chamada atualiza a posição e traz o delta da vizinhança
+            success = self.report(new_location)
             if success:
-                print(f"Sua localização foi atualizada para {new_location}")
-                self.refresh_nearby_users()
+                self.reported_location = new_location
+                logger.info("Sua localização foi atualizada para %s", new_location)
                 return True
             else:
-                print("Falha ao atualizar localização")
+                logger.warning("Falha ao atualizar localização")
                 return False
         except Exception as e:
-            print(f"Erro ao atualizar localização: {e}")
+            logger.error("Erro ao atualizar localização: %s", e)
+            return False
+    
+    def route(self, location):
+        """Migra o registro para o shard dono da localização, se ela mudou de região"""
+        shard = self.shard_map.shard_for(location)
+        if shard == self.shard:
             return False
+        
+        new_server = Pyro4.Proxy(self.shard_map.uri(shard))
+        if not new_server.register_user(self.username, location, str(self.uri), *self._format_args()):
+            raise Exception(f"Falha ao registrar usuário no shard {shard}")
+        try:
+            self.server.remove_user(self.username)
+        except Exception as e:
+            logger.warning("Erro ao sair do shard %d: %s", self.shard, e)
+        
+        logger.info("Usuário migrado do shard %d para o shard %d", self.shard, shard)
+        self.server = new_server
+        self.shard = shard
+        # O novo shard não conhece a última lista entregue: pedir a lista completa
+        self.report_version = None
+        return True
+    
+    def feed_location(self, new_location):
+        """Recebe posições de um feed contínuo (GPS) e envia ao servidor apenas o necessário"""
+        new_location = tuple(float(x) for x in new_location)
+        with self.location_lock:
+            self.location = new_location
+            displacement = distance_meters(self.reported_location, new_location)
+            if displacement < self.min_displacement:
+                # Deslocamento desprezível, mesmo que atravesse a borda de uma célula:
+                # o ruído do GPS em cima da borda não gera um envio por amostra
+                self.pending_location = None
+                return
+            crossed_cell = (self.movement_grid.cell_for(new_location)
+                            != self.movement_grid.cell_for(self.reported_location))
+            
+            self.pending_location = new_location
+            if crossed_cell:
+                # Mudar de célula pode alterar a vizinhança: enviar sem esperar a janela
+                if self.location_timer:
+                    self.location_timer.cancel()
+                    self.location_timer = None
+            elif self.location_timer is None:
+                # Agrupar a rajada: apenas a última posição da janela será enviada
+                self.location_timer = threading.Timer(self.debounce, self.flush_location)
+                self.location_timer.daemon = True
+                self.location_timer.start()
+                return
+            else:
+                return
+        
+        self.flush_location()
+    
+    def flush_location(self):
+        """Envia a última posição pendente do feed"""
+        with self.location_lock:
+            location = self.pending_location
+            self.pending_location = None
+            self.location_timer = None
+            if location is None:
+                return True
+        return self.update_location(location)
     
     def refresh_nearby_users(self):
         """Atualiza a lista de usuários próximos"""
         try:
-            print("\nDebug - Solicitando usuários próximos do servidor...")
-            self.nearby_users = self.server.get_nearby_users(self.username)
-            print(f"Debug - Resposta do servidor: {self.nearby_users}")
-            
-            # Atualizar proxies
-            new_proxies = {}
-            for user in self.nearby_users:
-                username = user['username']
-                if username in self.user_proxies:
-                    new_proxies[username] = self.user_proxies[username]
-                else:
-                    try:
-                        proxy = Pyro4.Proxy(user['uri'])
-                        new_proxies[username] = proxy
-                    except Exception as e:
-                        print(f"Debug - Erro ao criar proxy para {username}: {e}")
+            logger.debug("Solicitando usuários próximos do servidor...")
+            if self.wire_format == 'packed-v1':
+                nearby = self._decode_entries(self.server.get_nearby_users_packed(self.username))
+            else:
+                nearby = self.server.get_nearby_users(self.username)
+            logger.debug("Resposta do servidor: %s", nearby)
             
-            self.user_proxies = new_proxies
+            with self.nearby_lock:
+                self.nearby_users = nearby
+                self.sync_proxies()
             
-            print("\nUsuários próximos:")
             if not self.nearby_users:
-                print("Nenhum usuário próximo encontrado.")
-            else:
+                logger.info("Nenhum usuário próximo encontrado.")
+            elif logger.isEnabledFor(logging.DEBUG):
                 for i, user in enumerate(self.nearby_users):
-                    print(f"{i+1}. {user['username']} - {user['distance']:.2f}m")
+                    logger.debug("%d. %s - %.2fm", i + 1, user['username'], user['distance'])
             
             self.check_offline_messages()
             
         except Exception as e:
-            print(f"Erro ao atualizar lista de usuários: {e}")
-            print(f"Debug - Detalhes do erro: {type(e).__name__}")
+            logger.error("Erro ao atualizar lista de usuários: %s (%s)", e, type(e).__name__)
+    
+    def _format_args(self):
+        """Formato negociado, passado só a servidores que o conhecem (os antigos não têm o parâmetro)"""
+        return (self.wire_format,) if self.wire_format != 'dicts' else ()
+    
+    def _decode_entries(self, entries):
+        """Lista de vizinhos recebida como dicts ou no formato compacto negociado"""
+        if isinstance(entries, (list, tuple)):
+            return list(entries)
+        # O serializer serpent transporta bytes em base64; tobytes desfaz isso
+        return decode_nearby(serpent.tobytes(entries))
+    
+    def sync_proxies(self):
+        """Mantém um proxy para cada usuário da lista de próximos"""
+        new_proxies = {}
+        for user in self.nearby_users:
+            username = user['username']
+            if username in self.user_proxies:
+                new_proxies[username] = self.user_proxies[username]
+            else:
+                try:
+                    proxy = Pyro4.Proxy(user['uri'])
+                    new_proxies[username] = proxy
+                except Exception as e:
+                    logger.warning("Erro ao criar proxy para %s: %s", username, e)
+        
+        self.user_proxies = new_proxies
+    
+    def proximity_changed(self, entered, left):
+        """Método remoto chamado pelo servidor quando usuários entram ou saem do alcance.
+        
+        Síncrono de propósito: o servidor já entrega fora da thread de requisição, uma
+        chamada por vez para cada cliente, e um método oneway rodaria cada push em uma
+        thread própria, podendo aplicar "saiu" antes de "entrou".
+        """
+        try:
+            entered = self._decode_entries(entered)
+            self.apply_neighbour_delta(entered, left)
+            logger.debug("Proximidade alterada: entraram %s, saíram %s",
+                         [user['username'] for user in entered], left)
+        except Exception as e:
+            logger.error("Erro ao aplicar evento de proximidade: %s", e)
+    
+    def apply_neighbour_delta(self, entered, left, full=False):
+        """Aplica à lista de usuários próximos as entradas novas/alteradas e as saídas"""
+        with self.nearby_lock:
+            if full:
+                self.nearby_users = list(entered)
+            else:
+                changed = {user['username'] for user in entered} | set(left)
+                # Substituir a lista inteira para não expor um estado parcial às outras threads
+                self.nearby_users = [
+                    user for user in self.nearby_users if user['username'] not in changed
+                ] + list(entered)
+            self.sync_proxies()
+        
+        if entered:
+            # Quem entrou no alcance pode ter mensagens guardadas na caixa local
+            self.reveal_inbox([user['username'] for user in entered])
+        
+        if hasattr(self, 'gui'):
+            self.gui.root.after(0, self.gui.show_nearby_users)
+    
+    def report(self, location=None):
+        """Envia heartbeat (e a localização, se informada) e aplica o delta da vizinhança"""
+        result = self.server.report(self.username, location, self.report_version, *self._format_args())
+        if not result:
+            return False
+        self.report_version = result['version']
+        entered = self._decode_entries(result['entered'])
+        if result['full'] or entered or result['left']:
+            self.apply_neighbour_delta(entered, result['left'], full=result['full'])
+        return True
     
     def periodic_refresh(self):
-        """Atualiza a lista de usuários próximos periodicamente"""
+        """Atualiza a lista de usuários próximos periodicamente (fallback do push do servidor)"""
         while True:
-            time.sleep(120)  # 2 minutos
-            print("\nAtualizando lista de usuários próximos...")
+            time.sleep(600)  # 10 minutos
+            logger.debug("Atualizando lista de usuários próximos...")
             self.refresh_nearby_users()
     
     def send_heartbeat(self):
@@ -139,9 +303,11 @@ class ChatClient:
         while True:
             time.sleep(60)  # 1 minuto
             try:
-                self.server.user_heartbeat(self.username)
+                # O heartbeat também traz as mudanças da vizinhança desde a última versão
+                if not self.report():
+                    logger.warning("Servidor não reconheceu o usuário no heartbeat")
             except:
-                print("Erro ao enviar heartbeat para o servidor")
+                logger.warning("Erro ao enviar heartbeat para o servidor")
     
     def send_message(self, recipient, message):
         """Envia mensagem para outro usuário"""
@@ -152,7 +318,7 @@ class ChatClient:
             if not recipient_nearby:
                 # Se não estiver próximo, enviar para o servidor armazenar na fila
                 success, msg = self.server.send_message(self.username, recipient, message)
-                print(msg)
+                logger.info(msg)
                 return success
             
             # Se estiver próximo, tentar enviar diretamente
@@ -160,41 +326,55 @@ class ChatClient:
                 try:
                     proxy = self.user_proxies[recipient]
                     proxy.receive_message(self.username, message)
-                    print(f"Mensagem enviada para {recipient}")
+                    logger.debug("Mensagem enviada para %s", recipient)
                     return True
                 except Exception as e:
-                    print(f"Erro ao enviar mensagem diretamente: {e}")
+                    logger.error("Erro ao enviar mensagem diretamente: %s", e)
                     return False
             
             return False
         except Exception as e:
-            print(f"Erro no envio da mensagem: {e}")
+            logger.error("Erro no envio da mensagem: %s", e)
             return False
     
     def check_offline_messages(self):
-        """Verifica se há mensagens offline para o usuário"""
+        """Baixa as mensagens offline para a caixa local e exibe as de remetentes próximos"""
         try:
-            messages = self.server.get_offline_messages(self.username)
+            try:
+                messages = self.server.fetch_offline_messages(self.username)
+            except AttributeError:
+                # Servidor anterior: só entrega as de remetentes no alcance
+                messages = self.server.get_offline_messages(self.username)
             if messages:
-                for msg in messages:
-                    # Verificar se o remetente está próximo antes de mostrar a mensagem
-                    sender_nearby = any(user['username'] == msg['sender'] for user in self.nearby_users)
-                    
-                    if sender_nearby:
-                        if hasattr(self, 'gui'):
-                            self.gui.add_message(msg['sender'], "você", msg['message'])
-                        else:
-                            timestamp = datetime.fromisoformat(msg['timestamp']).strftime("%d/%m/%Y %H:%M:%S")
-                            print(f"[{timestamp}] De {msg['sender']}: {msg['message']}")
-                    else:
-                        # Se ainda não está próximo, devolver a mensagem para a fila
-                        self.server.store_offline_message(msg['sender'], self.username, msg['message'])
-                
+                self.inbox.add(messages)
+            
+            self.reveal_inbox(user['username'] for user in self.nearby_users)
             return True
         except Exception as e:
-            print(f"Erro ao verificar mensagens offline: {e}")
+            logger.error("Erro ao verificar mensagens offline: %s", e)
             return False
     
+    def reveal_inbox(self, senders):
+        """Exibe as mensagens guardadas dos remetentes informados que ainda não foram vistas"""
+        senders = set(senders) & self.inbox.pending_senders()
+        for msg in self.inbox.reveal(senders):
+            self.show_offline_message(msg)
+    
+    def deliver_offline_messages(self, messages):
+        """Método remoto chamado pelo servidor quando o remetente entra no alcance"""
+        # A caixa local descarta as que já foram baixadas por check_offline_messages
+        for msg in self.inbox.add(messages, revealed=True):
+            self.show_offline_message(msg)
+        return True
+    
+    def show_offline_message(self, msg):
+        """Exibe uma mensagem offline na interface ou no console"""
+        if hasattr(self, 'gui'):
+            self.gui.receive_message(msg['sender'], msg['message'])
+        else:
+            timestamp = datetime.fromisoformat(msg['timestamp']).strftime("%d/%m/%Y %H:%M:%S")
+            print(f"[{timestamp}] De {msg['sender']}: {msg['message']}")
+    
     def logout(self):
         """Realiza o logout do usuário"""
         try:
@@ -205,26 +385,32 @@ class ChatClient:
             if hasattr(self, 'daemon'):
                 self.daemon.shutdown()
             
-            print(f"Usuário {self.username} desconectado com sucesso")
+            logger.info("Usuário %s desconectado com sucesso", self.username)
         except Exception as e:
-            print(f"Erro ao fazer logout: {e}")
+            logger.error("Erro ao fazer logout: %s", e)
             raise e
 
 # Interface de linha de comando
 def main():
+    logging.basicConfig(
+        level=os.environ.get("CHAT_LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    
     # Iniciar interface gráfica de login
     login_window = LoginWindow()
     user_data = login_window.get_user_data()
     
     if not user_data:
-        print("Login cancelado")
+        logger.info("Login cancelado")
         return
     
     # Criar cliente com os dados do login
     client = ChatClient(user_data['username'], user_data['location'])
     
     # Criar e iniciar interface gráfica principal
-    chat_window = ChatWindow(client)
+    # CHAT_TRANSCRIPT_PATH: histórico da conversa em disco, paginável na janela
+    chat_window = ChatWindow(client, transcript_path=os.environ.get("CHAT_TRANSCRIPT_PATH"))
     client.gui = chat_window
     chat_window.run()
 
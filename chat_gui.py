@@ -1,12 +1,31 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
 import threading
+import logging
+import heapq
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import time
+from transcript_log import TranscriptLog
+
+logger = logging.getLogger(__name__)
 
 class ChatWindow:
-    def __init__(self, client):
+    def __init__(self, client, max_listed_users=100, scrollback_limit=1000, transcript_path=None):
         self.client = client
+        # A lista mostra apenas os mais próximos; as linhas exibidas ficam espelhadas aqui
+        self.max_listed_users = max_listed_users
+        self.listed = []  # [(username, texto)] na ordem do Listbox
+        
+        # Conversa: linhas acumuladas e aplicadas ao widget no máximo uma vez por quadro
+        self.scrollback_limit = scrollback_limit  # Linhas mantidas no widget
+        self.paged_in = 0  # Linhas antigas trazidas de volta do arquivo pelo usuário
+        self.visible_lines = 0
+        self.transcript_pending = []
+        self.transcript_lock = threading.Lock()  # Mensagens chegam das threads do Pyro
+        self.transcript_scheduled = False
+        self.transcript_log = TranscriptLog(transcript_path) if transcript_path else None
+        
         self.root = tk.Tk()
         self.root.title(f"Chat - {client.username}")
         self.root.geometry("800x600")
@@ -14,6 +33,13 @@ class ChatWindow:
         # Adicionar esta linha
         self.message_var = tk.StringVar()
         
+        # Chamadas de rede rodam fora do loop do Tk; os resultados voltam via root.after
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chat-gui")
+        self.pending = {}  # {descrição da operação: quantidade em andamento}
+        self.status_var = tk.StringVar(value="Pronto")
+        self.refresh_running = False
+        self.refresh_requested = False  # Cliques durante uma atualização viram uma só nova rodada
+        
         # Criar e configurar widgets
         self.create_widgets()
         
@@ -33,6 +59,14 @@ class ChatWindow:
         self.quit_button = ttk.Button(buttons_frame, text="Sair", command=self.logout)
         self.quit_button.pack(side=tk.LEFT, padx=5)
         
+        # Páginas antigas da conversa, lidas do histórico em disco
+        if self.transcript_log is not None:
+            ttk.Button(buttons_frame, text="Mensagens anteriores",
+                       command=self.load_older_messages).pack(side=tk.LEFT, padx=5)
+        
+        # Operações de rede em andamento
+        ttk.Label(buttons_frame, textvariable=self.status_var).pack(side=tk.LEFT, padx=5)
+        
         # Informações do usuário
         info_frame = ttk.LabelFrame(main_frame, text="Informações do Usuário", padding="5")
         info_frame.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 10))
@@ -64,6 +98,7 @@ class ChatWindow:
         
         # Frame para usuários próximos
         users_frame = ttk.LabelFrame(main_frame, text="Usuários Próximos", padding="5")
+        self.users_frame = users_frame
         users_frame.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), padx=(0, 5))
         
         refresh_btn = ttk.Button(users_frame, text="Atualizar Lista", command=self.refresh_users)
@@ -139,26 +174,134 @@ class ChatWindow:
             self.lat_var.set(str(self.client.location[0]))
             self.lon_var.set(str(self.client.location[1]))
     
+    def run_in_background(self, description, func, *args, on_done=None, on_error=None):
+        """Executa func no executor e aplica o resultado na thread do Tk"""
+        self.pending[description] = self.pending.get(description, 0) + 1
+        self.show_status()
+        future = self.executor.submit(func, *args)
+        
+        def done(future):
+            try:
+                self.root.after(0, self._finish, description, future, on_done, on_error)
+            except (RuntimeError, tk.TclError):
+                pass  # Janela já destruída
+        
+        future.add_done_callback(done)
+        return future
+    
+    def _finish(self, description, future, on_done, on_error):
+        count = self.pending.get(description, 0) - 1
+        if count > 0:
+            self.pending[description] = count
+        else:
+            self.pending.pop(description, None)
+        self.show_status()
+        
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error("Erro em '%s': %s", description, e)
+            if on_error:
+                on_error(e)
+            return
+        if on_done:
+            on_done(result)
+    
+    def show_status(self):
+        if not self.pending:
+            self.status_var.set("Pronto")
+            return
+        parts = [
+            description if count == 1 else f"{description} ({count})"
+            for description, count in self.pending.items()
+        ]
+        self.status_var.set("Em andamento: " + ", ".join(parts) + "...")
+    
     def update_location(self):
         try:
             lat = float(self.lat_var.get())
             lon = float(self.lon_var.get())
-            print(f"Debug - Tentando atualizar localização para: ({lat}, {lon})")
-            success = self.client.update_location((lat, lon))
+        except ValueError:
+            messagebox.showerror("Erro", "Coordenadas inválidas. Use números decimais.")
+            return
+        
+        logger.debug("Tentando atualizar localização para: (%s, %s)", lat, lon)
+        self.update_btn.state(['disabled'])
+        
+        def on_done(success):
             if success:
-                self.toggle_edit()
+                if 'readonly' not in self.lat_entry.state():
+                    self.toggle_edit()
                 self.refresh_users()
                 messagebox.showinfo("Sucesso", "Localização atualizada com sucesso!")
             else:
+                self.update_btn.state(['!disabled'])
                 messagebox.showerror("Erro", "Não foi possível atualizar a localização. Verifique o console para mais detalhes.")
-        except ValueError:
-            messagebox.showerror("Erro", "Coordenadas inválidas. Use números decimais.")
+        
+        def on_error(error):
+            self.update_btn.state(['!disabled'])
+            messagebox.showerror("Erro", f"Não foi possível atualizar a localização: {error}")
+        
+        self.run_in_background("atualizando localização", self.client.update_location, (lat, lon),
+                               on_done=on_done, on_error=on_error)
     
     def refresh_users(self):
-        self.users_list.delete(0, tk.END)
-        self.client.refresh_nearby_users()
-        for user in self.client.nearby_users:
-            self.users_list.insert(tk.END, f"{user['username']} - {user['distance']:.2f}m")
+        if self.refresh_running:
+            # Já há uma atualização em andamento: agendar apenas mais uma ao final
+            self.refresh_requested = True
+            return
+        self.refresh_running = True
+        
+        def finished(_=None):
+            self.refresh_running = False
+            self.show_nearby_users()
+            if self.refresh_requested:
+                self.refresh_requested = False
+                self.refresh_users()
+        
+        self.run_in_background("atualizando lista", self.client.refresh_nearby_users,
+                               on_done=finished, on_error=finished)
+    
+    def show_nearby_users(self):
+        """Atualiza a lista aplicando apenas as linhas que entraram, saíram ou mudaram"""
+        nearby = self.client.nearby_users
+        closest = heapq.nsmallest(self.max_listed_users, nearby, key=lambda user: user['distance'])
+        target = [(user['username'], f"{user['username']} - {user['distance']:.2f}m") for user in closest]
+        
+        total = len(nearby)
+        title = f"Usuários Próximos ({total})"
+        if total > len(target):
+            title = f"Usuários Próximos ({len(target)} de {total})"
+        if self.users_frame.cget('text') != title:
+            self.users_frame.config(text=title)
+        
+        if target == self.listed:
+            return
+        
+        # Remover quem saiu da lista, de baixo para cima para não deslocar os índices
+        wanted = {username for username, _ in target}
+        for index in range(len(self.listed) - 1, -1, -1):
+            if self.listed[index][0] not in wanted:
+                self.users_list.delete(index)
+                del self.listed[index]
+        
+        # Percorrer a ordem desejada corrigindo só as posições divergentes
+        for index, (username, text) in enumerate(target):
+            if index < len(self.listed) and self.listed[index] == (username, text):
+                continue
+            if index < len(self.listed) and self.listed[index][0] == username:
+                # Mesma posição, distância diferente
+                self.users_list.delete(index)
+            else:
+                # Usuário que mudou de posição: retirar da posição antiga
+                for old_index in range(index + 1, len(self.listed)):
+                    if self.listed[old_index][0] == username:
+                        self.users_list.delete(old_index)
+                        del self.listed[old_index]
+                        break
+                self.listed.insert(index, None)
+            self.users_list.insert(index, text)
+            self.listed[index] = (username, text)
     
     def send_message(self):
         recipient = self.recipient_var.get().strip()
@@ -174,32 +317,87 @@ class ChatWindow:
         if not recipient_nearby:
             messagebox.showinfo("Aviso", "Usuário não está próximo. Mensagem será entregue quando estiver no alcance.")
         
-        success = self.client.send_message(recipient, message)
-        if success:
-            self.add_message("Você", recipient, message)
-            self.message_var.set("")  # Limpar campo de mensagem
-        else:
-            messagebox.showerror("Erro", "Não foi possível enviar a mensagem")
+        def on_done(success):
+            if success:
+                self.add_message("Você", recipient, message)
+                if self.message_var.get().strip() == message:
+                    self.message_var.set("")  # Limpar campo de mensagem
+            else:
+                messagebox.showerror("Erro", "Não foi possível enviar a mensagem")
+        
+        def on_error(error):
+            messagebox.showerror("Erro", f"Não foi possível enviar a mensagem: {error}")
+        
+        self.run_in_background("enviando mensagem", self.client.send_message, recipient, message,
+                               on_done=on_done, on_error=on_error)
     
     def add_message(self, sender, recipient, message):
-        self.chat_area.config(state='normal')
+        """Enfileira uma linha na conversa; pode ser chamado de qualquer thread"""
         timestamp = datetime.now().strftime("%H:%M:%S")
-        self.chat_area.insert(tk.END, f"[{timestamp}] {sender} para {recipient}: {message}\n")
+        # Uma linha por mensagem, para que o limite e o histórico contem mensagens
+        line = f"[{timestamp}] {sender} para {recipient}: {message}".replace("\n", " ")
+        with self.transcript_lock:
+            self.transcript_pending.append(line)
+            if self.transcript_scheduled:
+                return
+            self.transcript_scheduled = True
+        try:
+            # Rajadas (como as mensagens offline) viram uma única atualização do widget
+            self.root.after(16, self.flush_transcript)
+        except (RuntimeError, tk.TclError):
+            # Janela destruída ou mainloop ainda não iniciado: a próxima linha tenta de novo
+            with self.transcript_lock:
+                self.transcript_scheduled = False
+    
+    def flush_transcript(self):
+        """Aplica ao widget as linhas acumuladas e descarta as que excedem o limite"""
+        with self.transcript_lock:
+            lines = self.transcript_pending
+            self.transcript_pending = []
+            self.transcript_scheduled = False
+        if not lines:
+            return
+        if self.transcript_log is not None:
+            self.transcript_log.append(lines)
+        
+        self.chat_area.config(state='normal')
+        self.chat_area.insert(tk.END, "\n".join(lines) + "\n")
+        self.visible_lines += len(lines)
+        excess = self.visible_lines - (self.scrollback_limit + self.paged_in)
+        if excess > 0:
+            self.chat_area.delete("1.0", f"{excess + 1}.0")
+            self.visible_lines -= excess
+            # As linhas removidas do topo são primeiro as trazidas do histórico
+            self.paged_in -= min(self.paged_in, excess)
         self.chat_area.see(tk.END)
         self.chat_area.config(state='disabled')
     
+    def load_older_messages(self, page=200):
+        """Traz de volta do histórico em disco as linhas anteriores às exibidas"""
+        if self.transcript_log is None:
+            return
+        stop = len(self.transcript_log) - self.visible_lines
+        lines = self.transcript_log.read(stop - page, stop)
+        if not lines:
+            return
+        self.chat_area.config(state='normal')
+        self.chat_area.insert("1.0", "\n".join(lines) + "\n")
+        self.chat_area.config(state='disabled')
+        self.chat_area.see("1.0")
+        self.visible_lines += len(lines)
+        self.paged_in += len(lines)
+    
     def receive_message(self, sender, message):
         """Recebe mensagem de outro usuário"""
-        # Usar o método add_message para adicionar a mensagem na interface
-        self.root.after(0, lambda: self.add_message(sender, "você", message))
+        self.add_message(sender, "você", message)
         return True
     
     def update_messages(self):
         """Thread para atualizar mensagens periodicamente"""
         while True:
             time.sleep(1)
-            # Verificar mensagens offline
-            self.root.after(0, self.client.check_offline_messages)
+            # Verificar mensagens offline nesta thread; a exibição volta ao Tk pelo cliente
+            self.client.check_offline_messages()
     
     def center_window(self):
         self.root.update_idletasks()
@@ -211,13 +409,16 @@ class ChatWindow:
     
     def logout(self):
         """Realiza o logout do usuário"""
-        try:
-            self.client.logout()  # Novo método que vamos criar
+        self.quit_button.state(['disabled'])
+        
+        def close(_=None):
+            self.executor.shutdown(wait=False)
+            if self.transcript_log is not None:
+                self.transcript_log.close()
             self.root.quit()
             self.root.destroy()
-        except Exception as e:
-            print(f"Erro ao fazer logout: {e}")
-            self.root.destroy()
+        
+        self.run_in_background("saindo", self.client.logout, on_done=close, on_error=close)
     
     def run(self):
         self.root.mainloop()
\ No newline at end of file
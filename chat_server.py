@@ -4,158 +4,541 @@ import pika
 import json
 import time
 import threading
-from math import sqrt, cos, radians
+import sys
+import os
+import logging
+import uuid
 from datetime import datetime
+from spatial_grid import SpatialGrid, distance_meters
+from proximity_engine import VectorizedProximityEngine
+from bulk_proximity import BulkProximityPool
+from presence_snapshot import PresenceSnapshot
+from offline_publisher import OfflinePublisher
+from offline_index import OfflineMessageIndex
+from legacy_queues import LegacyQueueDrain
+from proxy_pool import ProxyPool
+from callback_dispatcher import CallbackDispatcher
+from user_registry import UserRegistry
+from expiry_heap import ExpiryHeap
+from shard_map import ShardMap
+from metrics import metrics, instrument_methods, start_http_server
+from wire_format import NEARBY_FORMATS, JSON_CONTENT_TYPE, encode_nearby, encode_envelope
+
+logger = logging.getLogger(__name__)
+
+# Shard que consome a fila de mensagens offline; os demais consultam-no via Pyro
+OFFLINE_INDEX_SHARD = 0
+
+# Pontos de entrada chamados pelos clientes e pelos outros shards, medidos em metrics
+RPC_METHODS = (
+    'register_user', 'update_location', 'get_nearby_users', 'get_nearby_users_packed', 'report',
+    'send_message', 'get_offline_messages', 'fetch_offline_messages', 'user_heartbeat',
+    'remove_user', 'get_wire_formats', 'find_nearby_local', 'take_offline_messages',
+)
 
 @Pyro4.expose
+@instrument_methods('chat_server', RPC_METHODS)
 class ChatServer:
-    def __init__(self):
-        self.users = {}  # {username: {location: (lat, long), last_active: timestamp, uri: pyro_uri}}
-        self.offline_messages = {}  # {recipient: [messages]}
+    def __init__(self, use_vectorized=False, connection_factory=None, compact_envelopes=True,
+                 shard_map=None, shard_id=0, snapshot_path=None, snapshot_interval=30,
+                 async_connection_factory=None, offline_store_path=None, offline_spool_path=None):
+        # Fábricas de conexões com o broker (substituíveis por um dublê nos benchmarks)
+        self.connection_factory = connection_factory or pika.BlockingConnection
+        self.async_connection_factory = async_connection_factory or pika.SelectConnection
+        # Corpo binário para as mensagens offline (o índice lê também o JSON anterior)
+        self.compact_envelopes = compact_envelopes
+        
+        # Região atendida por este processo; sem mapa, um único servidor atende tudo
+        self.shard_map = shard_map or ShardMap()
+        self.shard_id = shard_id
+        self.pyro_name = self.shard_map.name(shard_id)
+        
+        # Parâmetros de conexão mais robustos
+        self.connection_parameters = pika.ConnectionParameters(
+            host='localhost',
+            heartbeat=600,
+            blocked_connection_timeout=300,
+            connection_attempts=3,
+            retry_delay=5
+        )
+        # Publicação assíncrona das mensagens offline (spool local e confirms em lote)
+        self.offline_publisher = OfflinePublisher(self.async_connection_factory, self.connection_parameters,
+                                                  spool_path=offline_spool_path or ':memory:')
+        # {username: {location: (lat, long), last_active: timestamp, uri: pyro_uri}}, com locks por shard
+        self.users = UserRegistry(shards=16)
+        self.inactivity_timeout = 300  # 5 minutos
+        self.expiry = ExpiryHeap()  # Prazos de inatividade, renovados a cada atividade
+        self.spatial_index = SpatialGrid(radius=200)  # Grade para buscas de proximidade
+        
+        # Motor vetorizado opcional (NumPy) com as coordenadas em arrays contíguos
+        self.proximity_engine = VectorizedProximityEngine() if use_vectorized else None
+        # Vizinhança atual de cada usuário, usada para enviar deltas por push
+        self.neighbors = {}  # {username: set(usernames)}
+        self.neighbors_lock = threading.Lock()
+        # Última lista entregue por report(): {username: (versão, {vizinho: distância})}
+        self.report_state = {}
+        
+        # Proxies Pyro reaproveitados entre chamadas aos clientes
+        self.proxy_pool = ProxyPool(max_size=256, connect_timeout=5)
+        # Eventos e entregas aos clientes fora das threads de requisição: (uri, método, argumentos, ao_falhar)
+        self.notifications = CallbackDispatcher(self.proxy_pool, workers=8)
         
-        if not self.setup_rabbitmq_connection():
+        # Snapshot periódico da presença para reinícios sem nova onda de registros
+        self.snapshot = PresenceSnapshot(snapshot_path) if snapshot_path else None
+        self.snapshot_interval = snapshot_interval
+        
+        if not self._setup_rabbitmq():
             raise Exception("Falha ao configurar conexão com RabbitMQ")
         
-        try:
-            # Fazer o binding com a nova exchange
-            self.channel.queue_bind(
-                exchange='chat_exchange',
-                queue='offline_messages',
-                routing_key='offline_messages.*'
+        # Iniciar o índice de mensagens offline pendentes (consumidor da fila durável,
+        # gravando em SQLite). Com shards, um único consumidor evita dividir a fila
+        self.offline_index = None
+        if shard_id == OFFLINE_INDEX_SHARD:
+            self.offline_index = OfflineMessageIndex(
+                self.connection_factory, self.connection_parameters,
+                path=offline_store_path or ':memory:', queue_name=self.offline_publisher.queue_name
             )
-        except Exception as e:
-            print(f"Erro ao fazer binding da fila: {e}")
-            raise e
+            self.offline_index.start()
         
-        # Iniciar consumidor de mensagens
-        #self.setup_message_consumer()
+        if self.snapshot is not None and self._restore_snapshot():
+            # A vizinhança usada nos deltas de push é recalculada sem atrasar o boot
+            recompute_thread = threading.Thread(target=self._recompute_all_neighbourhoods)
+            recompute_thread.daemon = True
+            recompute_thread.start()
+        
+        if self.offline_index is not None:
+            # Mensagens pendentes nas filas por destinatário da versão anterior
+            self.offline_index.legacy = LegacyQueueDrain(
+                self.connection_factory, self.connection_parameters, self.offline_index
+            )
+            self.offline_index.legacy.start(list(self.users))
         
         # Iniciar thread para monitorar usuários inativos
         self.monitor_thread = threading.Thread(target=self.monitor_inactive_users)
         self.monitor_thread.daemon = True
         self.monitor_thread.start()
         
-        print("Servidor de chat iniciado!")
+        if self.snapshot is not None:
+            self.snapshot_thread = threading.Thread(target=self._snapshot_loop)
+            self.snapshot_thread.daemon = True
+            self.snapshot_thread.start()
+        
+        logger.info("Servidor de chat iniciado!")
     
-    def setup_rabbitmq_connection(self):
-        """Configura ou reconfigura a conexão com RabbitMQ"""
+    def _setup_rabbitmq(self):
+        """Verifica o acesso ao RabbitMQ e declara a fila de mensagens offline"""
+        # O publicador e o índice mantêm suas próprias conexões; esta só valida o broker no boot
         try:
-            # Parâmetros de conexão mais robustos
-            parameters = pika.ConnectionParameters(
-                host='localhost',
-                heartbeat=600,
-                blocked_connection_timeout=300,
-                connection_attempts=3,
-                retry_delay=5
-            )
-            
-            self.connection = pika.BlockingConnection(parameters)
-            self.channel = self.connection.channel()
-            
-            # Configurar prefetch para melhor distribuição de carga
-            self.channel.basic_qos(prefetch_count=1)
-            
+            connection = self.connection_factory(self.connection_parameters)
             try:
-                # Tentar deletar a exchange se ela existir
-                self.channel.exchange_delete(exchange='chat_exchange')
-            except:
-                pass  # Ignora erro se a exchange não existir
-            
-            # Criar uma exchange própria
-            self.channel.exchange_declare(
-                exchange='chat_exchange',
-                exchange_type='topic',
-                durable=True
-            )
-            
-            # Declarar fila padrão
-            self.channel.queue_declare(
-                queue='offline_messages',
-                durable=True
-            )
-            
-            print("Conexão com RabbitMQ estabelecida com sucesso")
+                connection.channel().queue_declare(queue=self.offline_publisher.queue_name, durable=True)
+            finally:
+                connection.close()
+            logger.info("Conexão com RabbitMQ estabelecida com sucesso")
+            return True
+        except Exception as e:
+            logger.error("Erro ao configurar RabbitMQ: %s", e)
+            return False
+    
+    def _restore_snapshot(self):
+        """Restaura os usuários do snapshot local, exceto os que já teriam expirado"""
+        start = time.perf_counter()
+        try:
+            records = self.snapshot.load()
+        except Exception as e:
+            logger.warning("Snapshot de presença ignorado: %s", e)
+            return 0
+        
+        now = time.time()
+        records = [record for record in records if record[2] + self.inactivity_timeout > now]
+        # Inserções em lote: um lock por estrutura em vez de um por usuário
+        self.users.load(
+            (username, {'location': location, 'last_active': last_active, 'uri': uri})
+            for username, location, last_active, uri in records
+        )
+        self.expiry.touch_many((username, last_active + self.inactivity_timeout)
+                               for username, _, last_active, _ in records)
+        self.spatial_index.add_many((username, location) for username, location, _, _ in records)
+        if self.proximity_engine is not None:
+            for username, location, _, _ in records:
+                self.proximity_engine.add(username, location)
+        restored = len(records)
+        
+        logger.info("%d usuários restaurados do snapshot em %.0f ms",
+                    restored, (time.perf_counter() - start) * 1000)
+        return restored
+    
+    def _save_snapshot(self):
+        """Grava o registro de usuários no snapshot local"""
+        try:
+            start = time.perf_counter()
+            count = self.snapshot.save(self.users.items())
+            logger.debug("Snapshot de %d usuários gravado em %.0f ms",
+                         count, (time.perf_counter() - start) * 1000)
             return True
         except Exception as e:
-            print(f"Erro ao configurar RabbitMQ: {e}")
+            logger.error("Erro ao gravar snapshot de presença: %s", e)
             return False
     
-    def register_user(self, username, location, uri):
-        """Registra um novo usuário no sistema"""
+    def _snapshot_loop(self):
+        while True:
+            time.sleep(self.snapshot_interval)
+            self._save_snapshot()
+    
+    def register_user(self, username, location, uri, wire_format='dicts'):
+        """Registra um novo usuário no sistema.
+        
+        wire_format é o formato negociado por get_wire_formats para as listas de
+        vizinhos enviadas por push (proximity_changed); clientes antigos recebem dicts.
+        """
+        previous = self.users.get(username)
+        if previous and previous['uri'] != uri:
+            self.proxy_pool.evict(previous['uri'])
         self.users[username] = {
             'location': location,
             'last_active': time.time(),
-            'uri': uri
+            'uri': uri,
+            'wire_format': wire_format
         }
-        print(f"Usuário {username} registrado na posição {location}")
+        self.expiry.touch(username, time.time() + self.inactivity_timeout)
+        self.spatial_index.add(username, location)
+        if self.proximity_engine is not None:
+            self.proximity_engine.add(username, location)
+        logger.info("Usuário %s registrado na posição %s", username, location)
+        
+        # Um novo registro (ou reconexão) recebe a vizinhança completa por push
+        with self.neighbors_lock:
+            for other in self.neighbors.pop(username, set()):
+                self.neighbors.get(other, set()).discard(username)
+        self._refresh_neighbourhood(username)
         return True
     
     def update_location(self, username, new_location):
         """Atualiza a localização de um usuário"""
-        if username in self.users:
-            self.users[username]['location'] = new_location
-            self.users[username]['last_active'] = time.time()
-            print(f"Localização de {username} atualizada para {new_location}")
-            return True
-        return False
+        return self._move(username, new_location) is not None
+    
+    def _move(self, username, new_location, notify_self=True):
+        """Move o usuário e retorna a nova vizinhança ({vizinho: distância}), ou None se não existir"""
+        now = time.time()
+        if self.users.update(username, location=new_location, last_active=now):
+            self.expiry.touch(username, now + self.inactivity_timeout)
+            self.spatial_index.move(username, new_location)
+            if self.proximity_engine is not None:
+                self.proximity_engine.move(username, new_location)
+            logger.debug("Localização de %s atualizada para %s", username, new_location)
+            return self._refresh_neighbourhood(username, notify_self)
+        return None
     
     def get_nearby_users(self, username):
         """Retorna usuários próximos (até 200m)"""
-        if username not in self.users:
-            print(f"Usuário {username} não encontrado no servidor")
+        data = self.users.get(username)
+        if not data:
+            logger.warning("Usuário %s não encontrado no servidor", username)
             return []
         
-        user_location = self.users[username]['location']
+        user_location = data['location']
         nearby_users = []
         
-        print(f"\nDebug - Usuário {username} na posição {user_location}")
-        print("Debug - Todos os usuários:", self.users)
+        logger.debug("Usuário %s na posição %s", username, user_location)
+        
+        for other_user, distance in self.find_nearby(username, user_location):
+            entry = self._user_entry(other_user, distance)
+            if entry:
+                nearby_users.append(entry)
+        # Vizinhos do outro lado da fronteira do shard
+        nearby_users.extend(self._remote_nearby(username, user_location))
+        
+        self._mark_active(username)
+        return nearby_users
+    
+    def report(self, username, location=None, since_version=None, wire_format='dicts'):
+        """Heartbeat, atualização de localização e delta da vizinhança em uma única chamada.
+        
+        Se since_version for a última versão entregue ao cliente, retorna apenas quem
+        entrou, mudou de distância ou saiu; caso contrário retorna a lista completa.
+        Com wire_format='packed-v1', 'entered' vem no formato binário compacto.
+        """
+        if location is not None:
+            # A movimentação já recalcula a vizinhança: uma única varredura por chamada.
+            # O delta volta na resposta; só os vizinhos recebem push
+            nearby = self._move(username, location, notify_self=False)
+            if nearby is None:
+                return None
+        elif self._mark_active(username):
+            nearby = self._refresh_neighbourhood(username, notify_self=False)
+        else:
+            return None
+        
+        entries = {other: self._user_entry(other, distance) for other, distance in nearby.items()}
+        if self.shard_map.sharded:
+            data = self.users.get(username)
+            if data:
+                for entry in self._remote_nearby(username, data['location']):
+                    entries[entry['username']] = entry
+        entries = {other: entry for other, entry in entries.items() if entry}
+        distances = {other: entry['distance'] for other, entry in entries.items()}
+        
+        previous_version, previous = self.report_state.get(username, (0, None))
+        version = previous_version + 1
+        self.report_state[username] = (version, distances)
+        
+        if previous is None or since_version != previous_version:
+            entered = list(entries.values())
+            return {'version': version, 'full': True, 'entered': self._encode_entries(entered, wire_format),
+                    'left': []}
+        
+        # Distâncias que mudaram menos de 1 metro não são reenviadas
+        changed = [
+            entry for other, entry in entries.items()
+            if other not in previous or abs(previous[other] - entry['distance']) >= 1
+        ]
+        left = [other for other in previous if other not in entries]
+        return {'version': version, 'full': False, 'entered': self._encode_entries(changed, wire_format),
+                'left': left}
+    
+    def _mark_active(self, username):
+        """Atualiza a atividade do usuário e renova seu prazo de expiração"""
+        now = time.time()
+        if self.users.update(username, last_active=now):
+            self.expiry.touch(username, now + self.inactivity_timeout)
+            return True
+        return False
+    
+    def get_metrics(self):
+        """Contadores e histogramas de latência do processo (métodos, RabbitMQ e Pyro)"""
+        return metrics.snapshot()
+    
+    def get_wire_formats(self):
+        """Formatos de lista de vizinhos suportados, para negociação com o cliente"""
+        return NEARBY_FORMATS
+    
+    def get_nearby_users_packed(self, username):
+        """Mesmo resultado de get_nearby_users no formato binário compacto 'packed-v1'"""
+        return encode_nearby(self.get_nearby_users(username))
+    
+    def _encode_entries(self, entries, wire_format):
+        """Lista de vizinhos no formato negociado pelo cliente"""
+        if wire_format == 'packed-v1':
+            return encode_nearby(entries)
+        return entries
+    
+    def _user_entry(self, username, distance):
+        """Monta a entrada de um usuário como retornada por get_nearby_users"""
+        data = self.users.get(username)
+        if not data:
+            return None
+        return {
+            'username': username,
+            'location': data['location'],
+            'distance': distance,
+            'uri': data['uri']
+        }
+    
+    def _refresh_neighbourhood(self, username, notify_self=True):
+        """Recalcula a vizinhança de um usuário e notifica quem entrou ou saiu do alcance.
+        
+        Com notify_self=False o próprio usuário não recebe push (report() devolve o delta).
+        """
+        data = self.users.get(username)
+        if not data:
+            return {}
+        nearby = dict(self.find_nearby(username, data['location']))
+        
+        with self.neighbors_lock:
+            old = self.neighbors.get(username, set())
+            new = set(nearby)
+            self.neighbors[username] = new
+            entered = new - old
+            left = old - new
+            for other in entered:
+                self.neighbors.setdefault(other, set()).add(username)
+            for other in left:
+                self.neighbors.get(other, set()).discard(username)
+        
+        if not entered and not left:
+            return nearby
+        
+        if notify_self:
+            # O próprio usuário recebe o delta completo
+            self._notify(
+                username,
+                [self._user_entry(other, nearby[other]) for other in entered],
+                list(left)
+            )
+        # Cada vizinho afetado recebe apenas a mudança referente a este usuário
+        for other in entered:
+            self._notify(other, [self._user_entry(username, nearby[other])], [])
+        for other in left:
+            self._notify(other, [], [username])
+        
+        if entered:
+            self._deliver_pending(username, entered)
+        return nearby
+    
+    def _notify(self, username, entered, left):
+        """Enfileira um evento de proximidade para o callback Pyro do usuário"""
+        data = self.users.get(username)
+        entered = [entry for entry in entered if entry]
+        if data and (entered or left):
+            # Usuários restaurados do snapshot não têm o formato: dicts, que todos entendem
+            entered = self._encode_entries(entered, data.get('wire_format'))
+            self.notifications.put((data['uri'], 'proximity_changed', (entered, left), None))
+    
+    def _deliver_pending(self, username, entered):
+        """Entrega as mensagens offline entre o usuário e quem acabou de entrar no alcance"""
+        if self.offline_index is None:
+            # Shard sem o índice: o cliente busca as pendentes em get_offline_messages
+            return
+        # Mensagens que os novos vizinhos deixaram para o usuário
+        received = []
+        for other in entered:
+            received.extend(self.offline_index.take(username, other))
+        self._push_messages(username, received)
+        
+        # Mensagens que o usuário deixou para cada novo vizinho
+        for other in entered:
+            self._push_messages(other, self.offline_index.take(other, username))
+    
+    def _push_messages(self, recipient, messages):
+        """Enfileira a entrega de mensagens offline no callback Pyro do destinatário"""
+        if not messages:
+            return
+        data = self.users.get(recipient)
+        messages.sort(key=lambda message_data: message_data['timestamp'])
+        if not data:
+            self._requeue_messages(messages)
+            return
+        logger.debug("Entregando %d mensagens offline para %s", len(messages), recipient)
+        self.notifications.put((
+            data['uri'], 'deliver_offline_messages', (messages,),
+            lambda: self._requeue_messages(messages)
+        ))
+    
+    def _requeue_messages(self, messages):
+        """Devolve ao broker mensagens já retiradas do índice cuja entrega falhou"""
+        for message_data in messages:
+            self.offline_publisher.publish(message_data['recipient'], *self._encode_message(message_data))
+    
+    def _discard_user(self, username):
+        """Remove o usuário de todas as estruturas e avisa os vizinhos"""
+        data = self.users.pop(username, None)
+        if data is None:
+            return False
+        self.expiry.remove(username)
+        self.report_state.pop(username, None)
+        self.proxy_pool.evict(data['uri'])
+        self.spatial_index.remove(username)
+        if self.proximity_engine is not None:
+            self.proximity_engine.remove(username)
+        
+        with self.neighbors_lock:
+            old = self.neighbors.pop(username, set())
+            for other in old:
+                self.neighbors.get(other, set()).discard(username)
+        for other in old:
+            self._notify(other, [], [username])
+        return True
+    
+    def find_nearby(self, username, user_location, radius=200):
+        """Retorna [(username, distância)] dos usuários dentro do raio"""
+        if self.proximity_engine is not None and username in self.proximity_engine:
+            return self.proximity_engine.nearby(username, radius)
         
-        for other_user, data in self.users.items():
-            if other_user != username:
-                other_location = data['location']
+        result = []
+        # Consultar apenas as células vizinhas em vez de todos os usuários
+        for other_user in self.spatial_index.candidates(user_location, radius):
+            other_data = self.users.get(other_user)
+            if other_user != username and other_data:
+                other_location = other_data['location']
                 try:
                     distance = self.calculate_distance(user_location, other_location)
-                    print(f"Debug - Calculando distância entre {username} ({user_location}) e {other_user} ({other_location}): {distance:.2f}m")
-                    
-                    if distance <= 200:  # 200 metros
-                        nearby_users.append({
-                            'username': other_user,
-                            'location': other_location,
-                            'distance': distance,
-                            'uri': data['uri']
-                        })
+                    if distance <= radius:
+                        result.append((other_user, distance))
                 except Exception as e:
-                    print(f"Erro ao calcular distância: {e}")
+                    logger.error("Erro ao calcular distância: %s", e)
+        return result
+    
+    def find_nearby_local(self, location, radius=200, exclude=None):
+        """Usuários deste shard próximos de uma localização, chamado pelos shards vizinhos"""
+        entries = []
+        for other_user, distance in self.find_nearby(exclude, location, radius):
+            entry = self._user_entry(other_user, distance)
+            if entry:
+                entries.append(entry)
+        return entries
+    
+    def _remote_nearby(self, username, location, radius=200):
+        """Consulta os shards vizinhos quando o raio cruza a fronteira da região"""
+        if not self.shard_map.sharded:
+            return []
+        entries = []
+        for shard in self.shard_map.shards_for_area(location, radius):
+            if shard == self.shard_id:
+                continue
+            try:
+                with self.proxy_pool.checkout(self.shard_map.uri(shard)) as peer:
+                    entries.extend(peer.find_nearby_local(location, radius, username))
+            except Exception as e:
+                logger.warning("Shard %d indisponível para busca de vizinhos: %s", shard, e)
+        return entries
+    
+    def _recompute_all_neighbourhoods(self, notify=False, workers=None):
+        """Recalcula a vizinhança de todos os usuários.
         
-        self.users[username]['last_active'] = time.time()
-        return nearby_users
+        Com o motor vetorizado, o cálculo é feito pelo NumPy neste processo; sem ele,
+        em vários processos que só existem durante o recálculo (hoje, uma vez no boot).
+        Substitui o estado usado pelos deltas de push; com notify=True, cada usuário
+        cuja vizinhança mudou recebe o evento proximity_changed correspondente.
+        """
+        if self.proximity_engine is not None:
+            result = self.proximity_engine.all_neighbourhoods()
+        else:
+            snapshot = [(username, data['location']) for username, data in self.users.items()]
+            pool = BulkProximityPool(workers)
+            try:
+                result = pool.neighbourhoods(snapshot)
+            finally:
+                pool.close()
+        
+        changes = []
+        with self.neighbors_lock:
+            for username, nearby in result.items():
+                if username not in self.users:
+                    continue  # Removido durante o cálculo
+                old = self.neighbors.get(username, set())
+                new = {other for other, _ in nearby}
+                self.neighbors[username] = new
+                if notify and new != old:
+                    changes.append((username, dict(nearby), new - old, old - new))
+        
+        for username, nearby, entered, left in changes:
+            self._notify(username, [self._user_entry(other, nearby[other]) for other in entered], list(left))
+        logger.info("Vizinhança de %d usuários recalculada", len(result))
+        return len(result)
     
     def calculate_distance(self, loc1, loc2):
         """Calcula a distância euclidiana entre dois pontos em metros"""
         try:
-            # Convertendo coordenadas para metros (aproximadamente)
-            lat_to_meters = 111320  # 1 grau de latitude ≈ 111.32 km
-            lon_to_meters = 111320 * abs(cos(radians(loc1[0])))  # Ajusta longitude baseado na latitude
-            
-            # Calcula diferenças em metros
-            lat_diff = (loc1[0] - loc2[0]) * lat_to_meters
-            lon_diff = (loc1[1] - loc2[1]) * lon_to_meters
-            
-            distance = sqrt(lat_diff**2 + lon_diff**2)
-            print(f"Debug - Distância calculada: {distance:.2f}m")
-            return distance
+            # Mesma fórmula da grade espacial, que filtra os candidatos antes deste cálculo
+            return distance_meters(loc1, loc2)
         except Exception as e:
-            print(f"Erro no cálculo de distância: {e}")
+            logger.error("Erro no cálculo de distância: %s", e)
             raise e
     
     def send_message(self, sender, recipient, message):
         """Envia uma mensagem para outro usuário"""
-        if recipient not in self.users:
+        sender_data = self.users.get(sender)
+        recipient_data = self.users.get(recipient)
+        if sender_data and not recipient_data and self.shard_map.sharded:
+            # O destinatário pode estar registrado em outro shard
+            if self.store_offline_message(sender, recipient, message):
+                return True, "Usuário fora de alcance. Mensagem armazenada para entrega posterior."
+            return False, "Erro ao processar mensagem"
+        if not sender_data or not recipient_data:
             return False, "Usuário não encontrado"
         
-        sender_location = self.users[sender]['location']
-        recipient_location = self.users[recipient]['location']
+        sender_location = sender_data['location']
+        recipient_location = recipient_data['location']
         
         try:
             distance = self.calculate_distance(sender_location, recipient_location)
@@ -163,219 +546,148 @@ class ChatServer:
             if distance <= 200:
                 # Usuário está próximo, tentar enviar diretamente
                 try:
-                    recipient_proxy = Pyro4.Proxy(self.users[recipient]['uri'])
-                    success = recipient_proxy.receive_message(sender, message)
+                    with self.proxy_pool.checkout(recipient_data['uri']) as recipient_proxy:
+                        success = recipient_proxy.receive_message(sender, message)
                     if success:
                         return True, "Mensagem enviada diretamente"
                     else:
                         # Se falhar o envio direto, armazenar na fila
-                        self.store_offline_message(sender, recipient, message)
-                        return True, "Falha no envio direto. Mensagem armazenada para entrega posterior."
+                        if self.store_offline_message(sender, recipient, message):
+                            return True, "Falha no envio direto. Mensagem armazenada para entrega posterior."
+                        return False, "Erro ao armazenar mensagem"
                 except Exception as e:
-                    print(f"Erro ao enviar mensagem diretamente: {e}")
-                    self.store_offline_message(sender, recipient, message)
-                    return True, "Falha no envio direto. Mensagem armazenada para entrega posterior."
+                    logger.warning("Erro ao enviar mensagem diretamente: %s", e)
+                    if self.store_offline_message(sender, recipient, message):
+                        return True, "Falha no envio direto. Mensagem armazenada para entrega posterior."
+                    return False, "Erro ao armazenar mensagem"
             else:
                 # Usuário está longe, armazenar na fila
-                self.store_offline_message(sender, recipient, message)
-                return True, "Usuário fora de alcance. Mensagem armazenada para entrega posterior."
+                if self.store_offline_message(sender, recipient, message):
+                    return True, "Usuário fora de alcance. Mensagem armazenada para entrega posterior."
+                return False, "Erro ao armazenar mensagem"
         except Exception as e:
-            print(f"Erro ao enviar mensagem: {e}")
+            logger.error("Erro ao enviar mensagem: %s", e)
             return False, "Erro ao processar mensagem"
     
     def store_offline_message(self, sender, recipient, message):
-        """Armazena mensagem offline no RabbitMQ"""
-        max_retries = 3
-        current_try = 0
-        
-        while current_try < max_retries:
-            try:
-                if not self.ensure_connection():
-                    raise Exception("Não foi possível estabelecer conexão com RabbitMQ")
-                
-                message_data = {
-                    'sender': sender,
-                    'recipient': recipient,
-                    'message': message,
-                    'timestamp': datetime.now().isoformat()
-                }
-                print(f"Mensagem a ser armazenada: {message_data}")
-                
-                queue_name = f'offline_messages.{recipient}'
-                
-                # Declarar fila específica para o recipient
-                self.channel.queue_declare(
-                    queue=queue_name,
-                    durable=True
-                )
-
-                # Vincular a fila ao exchange 'chat_exchange' com a routing_key adequada
-                self.channel.queue_bind(
-                    queue=queue_name,
-                    exchange='chat_exchange',
-                    routing_key=queue_name  # A routing key deve corresponder àquela utilizada na publicação
-                )
-                
-                # Publicar mensagem
-                self.channel.basic_publish(
-                    exchange='chat_exchange',
-                    routing_key=queue_name,
-                    body=json.dumps(message_data),
-                    properties=pika.BasicProperties(
-                        delivery_mode=2,
-                        content_type='application/json'
-                    )
-                )
-                print(f"Mensagem publicada com sucesso para a fila {queue_name}")
-                return True
-                
-            except Exception as e:
-                print(f"Tentativa {current_try + 1} falhou: {e}")
-                current_try += 1
-                time.sleep(2)  # Esperar mais tempo entre tentativas
+        """Armazena mensagem offline e retorna True quando ela está gravada no spool local.
         
-        print("Falha após todas as tentativas")
-        return False
+        A publicação no RabbitMQ (e a confirmação do broker) segue em segundo plano.
+        """
+        future = self._enqueue_offline_message(sender, recipient, message)
+        # Só falhas de gravação no spool chegam aqui com o Future já resolvido
+        if future.done() and future.exception() is not None:
+            logger.error("Mensagem para %s não armazenada: %r", recipient, future.exception())
+            return False
+        return True
     
-    def setup_message_consumer(self):
-        """Configura o consumidor de mensagens"""
-        def callback(ch, method, properties, body):
-            message_data = json.loads(body)
-            recipient = message_data['recipient']
-            
-            if recipient not in self.offline_messages:
-                self.offline_messages[recipient] = []
-            self.offline_messages[recipient].append(message_data)
-            
-            # Confirmar processamento da mensagem
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-
-        self.channel.basic_consume(
-            queue='offline_messages',
-            on_message_callback=callback
-        )
-        # Iniciar thread para consumir mensagens
-        threading.Thread(target=self.channel.start_consuming, daemon=True).start()
+    def _enqueue_offline_message(self, sender, recipient, message):
+        """Enfileira a mensagem para publicação e retorna um Future com a confirmação do broker"""
+        message_data = {
+            'id': uuid.uuid4().hex,
+            'sender': sender,
+            'recipient': recipient,
+            'message': message,
+            'timestamp': datetime.now().isoformat()
+        }
+        logger.debug("Mensagem a ser armazenada: %s", message_data)
+        return self.offline_publisher.publish(recipient, *self._encode_message(message_data))
+    
+    def _encode_message(self, message_data):
+        """Serializa a mensagem offline; retorna (corpo, content_type)"""
+        # Mensagens antigas, sem id, continuam em JSON
+        if self.compact_envelopes and 'id' in message_data:
+            return encode_envelope(message_data)
+        return json.dumps(message_data), JSON_CONTENT_TYPE
     
     def get_offline_messages(self, username):
-        """Recupera mensagens offline para um usuário"""
+        """Recupera as mensagens offline de remetentes que estão no alcance do usuário"""
+        user_data = self.users.get(username)
+        if not user_data:
+            return []
+        
+        if self.shard_map.sharded:
+            # Remetentes podem estar em outros shards: usar a vizinhança completa
+            senders = [entry['username'] for entry in self.get_nearby_users(username)]
+            return self._take_offline(username, senders)
+        
+        user_location = user_data['location']
         messages = []
-        max_retries = 3
-        current_try = 0
         
-        while current_try < max_retries:
+        # Apenas os remetentes com mensagens pendentes para este usuário são avaliados
+        for sender in self.offline_index.senders_for(username):
+            data = self.users.get(sender)
+            if not data:
+                continue
             try:
-                if not self.ensure_connection():
-                    raise Exception("Não foi possível estabelecer conexão com RabbitMQ")
-                
-                queue_name = f'offline_messages.{username}'
-                
-                # Declarar fila se não existir
-                self.channel.queue_declare(
-                    queue=queue_name,
-                    durable=True
-                )
-                
-                print(f"Debug - Verificando fila {queue_name} para mensagens offline")
-                
-                # Consumir mensagens
-                while True:
-                    method_frame, header_frame, body = self.channel.basic_get(
-                        queue=queue_name,
-                        auto_ack=False
-                    )
-                    
-                    if not method_frame:
-                        break
-                    
-                    try:
-                        message_data = json.loads(body)
-                        sender = message_data['sender']
-                        
-                        if sender in self.users:
-                            distance = self.calculate_distance(
-                                self.users[sender]['location'],
-                                self.users[username]['location']
-                            )
-                            print(f"Debug - Verificando mensagem de {sender} para {username}. Distância: {distance:.2f}m")
-                            
-                            if distance <= 200:
-                                messages.append(message_data)
-                                self.channel.basic_ack(delivery_tag=method_frame.delivery_tag)
-                                print(f"Debug - Mensagem entregue: distância {distance:.2f}m <= 200m")
-                            else:
-                                print(f"Debug - Mensagem mantida na fila: distância {distance:.2f}m > 200m")
-                                self.channel.basic_reject(
-                                    delivery_tag=method_frame.delivery_tag,
-                                    requeue=True
-                                )
-                                break
-                        else:
-                            self.channel.basic_ack(delivery_tag=method_frame.delivery_tag)
-                            
-                    except Exception as e:
-                        print(f"Erro ao processar mensagem: {e}")
-                        self.channel.basic_reject(
-                            delivery_tag=method_frame.delivery_tag,
-                            requeue=True
-                        )
-                
-                print(f"Debug - Total de mensagens encontradas: {len(messages)}")
-                return messages
-                
+                distance = self.calculate_distance(data['location'], user_location)
             except Exception as e:
-                print(f"Tentativa {current_try + 1} falhou: {e}")
-                current_try += 1
-                time.sleep(2)
+                logger.error("Erro ao processar mensagens de %s: %s", sender, e)
+                continue
+            logger.debug("Verificando mensagens de %s para %s. Distância: %.2fm", sender, username, distance)
+            
+            if distance <= 200:
+                messages.extend(self.offline_index.take(username, sender))
         
-        print("Falha após todas as tentativas")
+        messages.sort(key=lambda message_data: message_data['timestamp'])
+        logger.debug("Total de mensagens encontradas: %d", len(messages))
+        return messages
+    
+    def fetch_offline_messages(self, username):
+        """Retira todas as mensagens offline do usuário, inclusive de remetentes fora do alcance.
+        
+        O cliente as guarda na caixa de entrada local e as exibe quando o remetente
+        entrar no alcance, sem devolvê-las ao broker.
+        """
+        if not self._mark_active(username):
+            return []
+        return self._take_offline(username)
+    
+    def take_offline_messages(self, recipient, senders=None):
+        """Retira do índice as mensagens dos remetentes (todos, se None) para o destinatário"""
+        return self._take_offline(recipient, senders)
+    
+    def _take_offline(self, recipient, senders=None):
+        if self.offline_index is None:
+            with self.proxy_pool.checkout(self.shard_map.uri(OFFLINE_INDEX_SHARD)) as owner:
+                return owner.take_offline_messages(recipient, senders)
+        
+        pending = set(self.offline_index.senders_for(recipient))
+        if senders is None:
+            senders = pending
+        messages = []
+        for sender in senders:
+            if sender in pending:
+                messages.extend(self.offline_index.take(recipient, sender))
+        messages.sort(key=lambda message_data: message_data['timestamp'])
         return messages
     
     def user_heartbeat(self, username):
         """Atualiza o timestamp de atividade do usuário"""
-        if username in self.users:
-            self.users[username]['last_active'] = time.time()
-            return True
-        return False
+        return self._mark_active(username)
     
     def monitor_inactive_users(self):
-        """Remove usuários inativos após 5 minutos"""
+        """Remove usuários assim que ficam inativos por mais de 5 minutos"""
         while True:
-            current_time = time.time()
-            inactive_users = []
-            
-            for username, data in self.users.items():
-                if current_time - data['last_active'] > 300:  # 5 minutos
-                    inactive_users.append(username)
-            
-            for username in inactive_users:
-                print(f"Removendo usuário inativo: {username}")
-                del self.users[username]
-            
-            time.sleep(60)  # Verificar a cada minuto
-    
-    def ensure_connection(self):
-        """Garante que a conexão está ativa"""
-        try:
-            if not self.connection or not self.connection.is_open:
-                print("Conexão fechada. Reconectando...")
-                return self.setup_rabbitmq_connection()
-            if not self.channel or not self.channel.is_open:
-                print("Canal fechado. Recriando...")
-                self.channel = self.connection.channel()
-                self.channel.basic_qos(prefetch_count=1)
-                return True
-            return True
-        except Exception as e:
-            print(f"Erro ao verificar conexão: {e}")
-            return False
+            # Dorme até o próximo prazo vencer em vez de varrer todos os usuários
+            for username in self.expiry.wait_expired():
+                data = self.users.get(username)
+                if not data:
+                    continue
+                idle = time.time() - data['last_active']
+                if idle > self.inactivity_timeout:
+                    metrics.counter('chat_server_users_expired_total').inc()
+                    logger.info("Removendo usuário inativo: %s", username)
+                    self._discard_user(username)
+                else:
+                    # Atividade registrada sem renovar o prazo: reagendar
+                    self.expiry.touch(username, data['last_active'] + self.inactivity_timeout)
     
     def remove_user(self, username):
         """Remove um usuário do sistema"""
         try:
-            if username in self.users:
-                del self.users[username]
-                print(f"Usuário {username} removido do servidor")
+            if self._discard_user(username):
+                logger.info("Usuário %s removido do servidor", username)
                 
                 # # Limpar fila de mensagens offline
                 # queue_name = f'offline_messages.{username}'
@@ -387,20 +699,59 @@ class ChatServer:
                 return True
             return False
         except Exception as e:
-            print(f"Erro ao remover usuário: {e}")
+            logger.error("Erro ao remover usuário: %s", e)
             return False
 
 # Iniciar o servidor
 if __name__ == "__main__":
+    # Nível de log configurável; DEBUG reativa as mensagens do caminho crítico
+    logging.basicConfig(
+        level=os.environ.get("CHAT_LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    
+    # --shard N: este processo atende a faixa N do mapa definido por CHAT_SHARDS
+    shard_id = 0
+    if '--shard' in sys.argv:
+        shard_id = int(sys.argv[sys.argv.index('--shard') + 1])
+    shard_map = ShardMap.from_env()
+    # Endpoint de scrape opcional; com shards, cada processo usa a porta base + shard
+    if os.environ.get("CHAT_METRICS_PORT"):
+        start_http_server(int(os.environ["CHAT_METRICS_PORT"]) + shard_id)
+    
+    server = ChatServer(
+        use_vectorized='--vectorized' in sys.argv,
+        shard_map=shard_map,
+        shard_id=shard_id,
+        snapshot_path=os.environ.get("CHAT_SNAPSHOT_PATH", f"{shard_map.name(shard_id)}.snapshot"),
+        # Mensagens offline pendentes, gravadas pelo shard que consome a fila
+        offline_store_path=os.environ.get("CHAT_OFFLINE_DB", f"{shard_map.name(shard_id)}.offline.sqlite3"),
+        # Mensagens aceitas por send_message e ainda não confirmadas pelo broker
+        offline_spool_path=os.environ.get("CHAT_OFFLINE_SPOOL", f"{shard_map.name(shard_id)}.spool.sqlite3")
+    )
+    
+    if '--asyncio' in sys.argv:
+        # Front-end asyncio (protocolo em quadros) no lugar do daemon Pyro
+        import asyncio
+        from async_server import AsyncChatServer
+        port = int(os.environ.get("CHAT_ASYNC_PORT", "9091"))
+        try:
+            asyncio.run(AsyncChatServer(server, port=port).serve_forever())
+        finally:
+            server._save_snapshot()
+        sys.exit(0)
+    
     # Criar e registrar o servidor no name server
     daemon = Pyro4.Daemon()
     ns = Pyro4.locateNS()
     
-    server = ChatServer()
     uri = daemon.register(server)
     
     # Registrar o servidor no name server
-    ns.register("chat.server", uri)
+    ns.register(server.pyro_name, uri)
     
-    print(f"Servidor de chat disponível em: {uri}")
-    daemon.requestLoop()
\ No newline at end of file
+    logger.info("Servidor de chat disponível em: %s", uri)
+    try:
+        daemon.requestLoop()
+    finally:
+        server._save_snapshot()
\ No newline at end of file
@@ -0,0 +1,65 @@
+import heapq
+import threading
+import time
+
+
+class ExpiryHeap:
+    """Min-heap de prazos de expiração com invalidação preguiçosa.
+
+    Cada renovação apenas empilha um novo prazo (O(log N)); entradas antigas são
+    ignoradas quando chegam ao topo, comparando com o prazo vigente do usuário.
+    """
+
+    def __init__(self):
+        self.heap = []  # [(prazo, username)]
+        self.deadlines = {}  # {username: prazo vigente}
+        self.condition = threading.Condition()
+
+    def touch(self, username, deadline):
+        """Define (ou renova) o prazo de expiração de um usuário"""
+        with self.condition:
+            self.deadlines[username] = deadline
+            heapq.heappush(self.heap, (deadline, username))
+            # Entradas obsoletas se acumulam com as renovações: reconstruir de vez em quando
+            if len(self.heap) > 2 * len(self.deadlines) + 1024:
+                self.heap = [(d, u) for u, d in self.deadlines.items()]
+                heapq.heapify(self.heap)
+            if self.heap[0] == (deadline, username):
+                # Novo prazo mais cedo que o anterior: acordar quem está esperando
+                self.condition.notify()
+
+    def touch_many(self, entries):
+        """Define os prazos de [(username, prazo)] de uma vez, reconstruindo o heap"""
+        with self.condition:
+            self.deadlines.update(entries)
+            self.heap = [(d, u) for u, d in self.deadlines.items()]
+            heapq.heapify(self.heap)
+            self.condition.notify()
+
+    def remove(self, username):
+        """Esquece o prazo de um usuário (a entrada no heap é descartada depois)"""
+        with self.condition:
+            self.deadlines.pop(username, None)
+
+    def _pop_expired(self, now):
+        expired = []
+        while self.heap and self.heap[0][0] <= now:
+            deadline, username = heapq.heappop(self.heap)
+            if self.deadlines.get(username) == deadline:
+                del self.deadlines[username]
+                expired.append(username)
+        return expired
+
+    def wait_expired(self):
+        """Bloqueia até que ao menos um usuário expire e retorna os expirados"""
+        with self.condition:
+            while True:
+                now = time.time()
+                expired = self._pop_expired(now)
+                if expired:
+                    return expired
+                timeout = self.heap[0][0] - now if self.heap else None
+                self.condition.wait(timeout)
+
+    def __len__(self):
+        return len(self.deadlines)
@@ -0,0 +1,145 @@
+import queue
+import threading
+import time
+import logging
+
+import pika
+
+from metrics import metrics
+from wire_format import decode_envelope
+from offline_index import REQUIRED_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Layout da versão anterior: uma fila durável por destinatário, ligada a chat_exchange,
+# e uma fila agregada (offline_messages.*) que recebia uma cópia e nunca era consumida
+LEGACY_AGGREGATE_QUEUE = 'offline_messages'
+LEGACY_QUEUE_PREFIX = 'offline_messages.'
+
+
+class LegacyQueueDrain:
+    """Move para o índice as mensagens pendentes nas filas por destinatário da versão anterior.
+
+    O AMQP não lista filas: os nomes vêm dos destinatários encontrados na fila agregada
+    (no boot), dos usuários restaurados do snapshot e de cada destinatário consultado
+    no índice pela primeira vez (nomes com ponto nunca chegaram à fila agregada). Cada
+    fila é esvaziada uma única vez e removida; a agregada só contém cópias (inclusive
+    de mensagens já entregues) e é removida depois que as filas que ela revelou foram
+    migradas.
+    """
+
+    def __init__(self, connection_factory, parameters, index):
+        self.connection_factory = connection_factory
+        self.parameters = parameters
+        self.index = index
+        self.checked = set()  # Destinatários já enfileirados para verificação
+        self.lock = threading.Lock()
+        self.names = queue.Queue()
+        self.aggregate_done = False
+        self.migrated = metrics.counter('offline_legacy_messages_total')
+
+    def start(self, recipients=()):
+        for recipient in recipients:
+            self.request(recipient)
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def request(self, recipient):
+        """Agenda a verificação da fila anterior do destinatário, se ainda não foi feita"""
+        with self.lock:
+            if recipient in self.checked:
+                return
+            self.checked.add(recipient)
+        self.names.put(recipient)
+
+    def _run(self):
+        while True:
+            connection = None
+            name = None
+            try:
+                connection = self.connection_factory(self.parameters)
+                if not self.aggregate_done:
+                    self._drain_aggregate(connection)
+                    self.aggregate_done = True
+                while True:
+                    name = self.names.get()
+                    self._drain_recipient(connection, name)
+                    name = None
+            except Exception as e:
+                logger.error("Migração das filas offline anteriores interrompida: %s. Reconectando...", e)
+                if name is not None:
+                    self.names.put(name)
+                time.sleep(5)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+    def _drain_aggregate(self, connection):
+        """Migra as filas dos destinatários presentes na fila agregada e a remove"""
+        channel = connection.channel()
+        if not self._exists(channel, LEGACY_AGGREGATE_QUEUE):
+            return
+        # Lida sem ack: se a migração cair no meio, a fila volta inteira no próximo boot
+        recipients = set()
+        while True:
+            method, properties, body = channel.basic_get(queue=LEGACY_AGGREGATE_QUEUE, auto_ack=False)
+            if method is None:
+                break
+            try:
+                recipients.add(decode_envelope(body, getattr(properties, 'content_type', None))['recipient'])
+            except Exception as e:
+                logger.warning("Mensagem ilegível na fila agregada anterior: %s", e)
+        logger.info("Fila agregada anterior: %d destinatários a migrar", len(recipients))
+        for recipient in recipients:
+            with self.lock:
+                self.checked.add(recipient)
+            self._drain_recipient(connection, recipient)
+        channel.queue_delete(queue=LEGACY_AGGREGATE_QUEUE)
+        channel.close()
+
+    def _drain_recipient(self, connection, recipient):
+        """Grava no índice as mensagens da fila anterior do destinatário e a remove"""
+        queue_name = f'{LEGACY_QUEUE_PREFIX}{recipient}'
+        # Canal próprio: as delivery tags (e o ack múltiplo) não se misturam com a agregada
+        channel = connection.channel()
+        if not self._exists(channel, queue_name):
+            return
+        messages = []
+        last_tag = None
+        while True:
+            method, properties, body = channel.basic_get(queue=queue_name, auto_ack=False)
+            if method is None:
+                break
+            try:
+                message_data = decode_envelope(body, getattr(properties, 'content_type', None))
+                missing = [field for field in REQUIRED_FIELDS if field not in message_data]
+                if missing:
+                    raise ValueError(f"campos ausentes: {', '.join(missing)}")
+            except Exception as e:
+                logger.error("Mensagem offline anterior inválida descartada: %s", e)
+                channel.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+                continue
+            messages.append(message_data)
+            last_tag = method.delivery_tag
+        if messages:
+            # Gravadas antes do ack: uma queda aqui só causa reentrega (ignorada pelo id)
+            added = self.index.add(messages)
+            channel.basic_ack(delivery_tag=last_tag, multiple=True)
+            self.migrated.inc(added)
+            logger.info("%d mensagens offline de %s migradas da fila anterior", added, queue_name)
+        channel.queue_delete(queue=queue_name, if_empty=True)
+        channel.close()
+
+    @staticmethod
+    def _exists(channel, queue_name):
+        try:
+            channel.queue_declare(queue=queue_name, passive=True)
+            return True
+        except pika.exceptions.ChannelClosedByBroker as e:
+            if e.reply_code == 404:
+                return False  # O broker fecha o canal ao responder 404
+            raise
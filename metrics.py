@@ -0,0 +1,193 @@
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Limites superiores (segundos) dos buckets de latência
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Histogram:
+    """Histograma de buckets fixos; observe() custa uma busca binária e um lock"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # O último bucket é +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """Contadores e histogramas por nome e rótulos, exportados como texto ou dicionário.
+
+    As métricas são criadas uma vez (fora do caminho crítico) e atualizadas pelo
+    objeto retornado, sem consultar o registro a cada chamada.
+    """
+
+    def __init__(self):
+        self.counters = {}  # {(nome, rótulos): Counter}
+        self.histograms = {}  # {(nome, rótulos): Histogram}
+        self.lock = threading.Lock()
+
+    def counter(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            metric = self.counters.get(key)
+            if metric is None:
+                metric = self.counters[key] = Counter()
+            return metric
+
+    def histogram(self, name, buckets=DEFAULT_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            metric = self.histograms.get(key)
+            if metric is None:
+                metric = self.histograms[key] = Histogram(buckets)
+            return metric
+
+    def snapshot(self):
+        """Valores atuais em estruturas simples, serializáveis pelo Pyro"""
+        with self.lock:
+            counters = list(self.counters.items())
+            histograms = list(self.histograms.items())
+        result = {'counters': [], 'histograms': []}
+        for (name, labels), metric in counters:
+            result['counters'].append({'name': name, 'labels': dict(labels), 'value': metric.value})
+        for (name, labels), metric in histograms:
+            counts, total, count = metric.snapshot()
+            result['histograms'].append({
+                'name': name, 'labels': dict(labels), 'buckets': list(metric.buckets),
+                'counts': counts, 'sum': total, 'count': count
+            })
+        return result
+
+    def render_text(self):
+        """Formato texto de exposição do Prometheus"""
+        with self.lock:
+            counters = sorted(self.counters.items(), key=lambda item: item[0])
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+        lines = []
+        for (name, labels), metric in counters:
+            lines.append(f"{name}{_label_text(labels)} {metric.value}")
+        for (name, labels), metric in histograms:
+            counts, total, count = metric.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(metric.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_label_text(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(labels)} {total}")
+            lines.append(f"{name}_count{_label_text(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+# Registro do processo, compartilhado pelos módulos como o logger
+metrics = MetricsRegistry()
+
+
+def instrument_methods(prefix, methods):
+    """Decorador de classe que mede chamadas e erros dos métodos listados.
+
+    Apenas os pontos de entrada remotos devem ser listados: auxiliares chamados em
+    laços (cálculo de distância, buscas) pagariam o custo da medição a cada iteração.
+    Deve ficar abaixo de @Pyro4.expose, para que o Pyro exponha os métodos já medidos.
+    """
+    def decorate(cls):
+        for name in methods:
+            setattr(cls, name, _instrument(vars(cls)[name], prefix, name))
+        return cls
+    return decorate
+
+
+def _instrument(method, prefix, name):
+    histogram = metrics.histogram(f"{prefix}_call_seconds", method=name)
+    errors = metrics.counter(f"{prefix}_call_errors_total", method=name)
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - start)
+    return wrapper
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = metrics
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("Scrape de métricas: " + format, *args)
+
+
+def start_http_server(port, host='0.0.0.0'):
+    """Serve as métricas em texto simples em http://host:port/metrics"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    logger.info("Métricas disponíveis em http://%s:%d/metrics", host, port)
+    return server
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+def message_id(message_data):
+    """Id da mensagem; mensagens antigas, sem id, recebem um derivado do conteúdo"""
+    if message_data.get('id'):
+        return message_data['id']
+    key = f"{message_data['sender']}\x00{message_data['timestamp']}\x00{message_data['message']}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def inbox_file(directory, username):
+    """Caminho da caixa local do usuário dentro de directory.
+
+    Nomes com caracteres fora de [A-Za-z0-9_-] (como '/' ou '..') viram um hash, para
+    que o arquivo nunca saia do diretório; a caixa de um nome assim criada pela versão
+    anterior (inbox-<nome>.sqlite3 no próprio diretório) é renomeada para o novo caminho.
+    """
+    if re.fullmatch(r'[A-Za-z0-9_-]+', username):
+        return os.path.join(directory, f"inbox-{username}.sqlite3")
+    path = os.path.join(directory, f"inbox.{hashlib.sha256(username.encode('utf-8')).hexdigest()[:32]}.sqlite3")
+    legacy = os.path.join(directory, f"inbox-{username}.sqlite3")
+    if (not os.path.exists(path) and os.path.isfile(legacy)
+            and os.path.dirname(os.path.realpath(legacy)) == os.path.realpath(directory)):
+        os.replace(legacy, path)
+    return path
+
+
+class OfflineInbox:
+    """Caixa de entrada local (SQLite) das mensagens offline, sem duplicatas por id.
+
+    As mensagens ficam guardadas no cliente até o remetente entrar no alcance, em vez
+    de voltarem para o broker a cada verificação. As já exibidas ficam por retention
+    segundos, para descartar reentregas, e depois são apagadas.
+    """
+
+    def __init__(self, path, retention=7 * 24 * 3600):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Usada pelas threads de atualização, heartbeat, Pyro e da interface
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.retention = retention
+        self.last_prune = 0
+        with self.lock, self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id TEXT PRIMARY KEY,
+                    sender TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    revealed INTEGER NOT NULL DEFAULT 0,
+                    revealed_at REAL
+                )
+            """)
+            columns = {row[1] for row in self.connection.execute("PRAGMA table_info(messages)")}
+            if 'revealed_at' not in columns:
+                # Caixa criada pela versão anterior: as já exibidas contam a partir de agora
+                self.connection.execute("ALTER TABLE messages ADD COLUMN revealed_at REAL")
+                self.connection.execute(
+                    "UPDATE messages SET revealed_at = ? WHERE revealed = 1", (time.time(),)
+                )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS pending_by_sender ON messages (revealed, sender)"
+            )
+        self.prune()
+
+    def add(self, messages, revealed=False):
+        """Guarda as mensagens ainda desconhecidas e retorna apenas essas"""
+        added = []
+        with self.lock, self.connection:
+            for message_data in messages:
+                cursor = self.connection.execute(
+                    "INSERT OR IGNORE INTO messages (id, sender, message, timestamp, revealed, revealed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (message_id(message_data), message_data['sender'], message_data['message'],
+                     message_data['timestamp'], int(revealed), time.time() if revealed else None)
+                )
+                if cursor.rowcount:
+                    added.append(message_data)
+        return added
+
+    def pending_senders(self):
+        """Remetentes com mensagens ainda não exibidas"""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT DISTINCT sender FROM messages WHERE revealed = 0"
+            ).fetchall()
+        return {sender for (sender,) in rows}
+
+    def reveal(self, senders):
+        """Marca como exibidas e retorna as mensagens pendentes dos remetentes, por horário"""
+        senders = list(senders)
+        if not senders:
+            return []
+        placeholders = ",".join("?" * len(senders))
+        with self.lock, self.connection:
+            rows = self.connection.execute(
+                f"SELECT id, sender, message, timestamp FROM messages "
+                f"WHERE revealed = 0 AND sender IN ({placeholders}) ORDER BY timestamp",
+                senders
+            ).fetchall()
+            now = time.time()
+            self.connection.executemany(
+                "UPDATE messages SET revealed = 1, revealed_at = ? WHERE id = ?", [(now, row[0]) for row in rows]
+            )
+        if time.time() - self.last_prune > 3600:
+            self.prune()
+        return [
+            {'id': id_, 'sender': sender, 'message': message, 'timestamp': timestamp}
+            for id_, sender, message, timestamp in rows
+        ]
+
+    def prune(self):
+        """Apaga as mensagens exibidas há mais de retention segundos; retorna quantas"""
+        now = time.time()
+        with self.lock, self.connection:
+            self.last_prune = now
+            cursor = self.connection.execute(
+                "DELETE FROM messages WHERE revealed = 1 AND revealed_at < ?", (now - self.retention,)
+            )
+        return cursor.rowcount
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,164 @@
+import sqlite3
+import threading
+import time
+import logging
+
+from metrics import metrics
+from wire_format import decode_envelope
+from offline_inbox import message_id
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = ('sender', 'recipient', 'message', 'timestamp')
+
+
+class OfflineMessageIndex:
+    """Mensagens offline pendentes, por destinatário e remetente, guardadas em SQLite.
+
+    O consumidor grava cada lote recebido da fila durável e só então o confirma no
+    broker: as pendentes não dependem de entregas sem ack (nem do consumer_timeout do
+    RabbitMQ) e sobrevivem a reinícios. Em memória ficam apenas as contagens por par
+    (destinatário, remetente), para descartar consultas sem mensagens sem tocar no banco.
+    """
+
+    def __init__(self, connection_factory, parameters, path=':memory:', queue_name='offline_index',
+                 prefetch=500):
+        self.connection_factory = connection_factory
+        self.parameters = parameters
+        self.queue_name = queue_name
+        self.prefetch = prefetch  # Mensagens recebidas e ainda não gravadas, no máximo
+        self.batch = []  # (delivery_tag, message_data) recebidas desde o último commit
+        self.lock = threading.Lock()
+        self.connection = None
+        self.channel = None
+        self.ready = threading.Event()
+        self.legacy = None  # LegacyQueueDrain, avisado do primeiro uso de cada destinatário
+        self.received = metrics.counter('offline_index_messages_total')
+        self.acked = metrics.counter('offline_index_acks_total')
+        self.reconnects = metrics.counter('offline_index_reconnects_total')
+
+        # Usado pela thread do consumidor e pelas threads de requisição
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS pending (
+                    id TEXT PRIMARY KEY,
+                    recipient TEXT NOT NULL,
+                    sender TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    timestamp TEXT NOT NULL
+                )
+            """)
+            self.db.execute("CREATE INDEX IF NOT EXISTS pending_by_pair ON pending (recipient, sender)")
+            rows = self.db.execute(
+                "SELECT recipient, sender, COUNT(*) FROM pending GROUP BY recipient, sender"
+            ).fetchall()
+        self.pairs = {}  # {recipient: {sender: quantidade}}
+        for recipient, sender, count in rows:
+            self.pairs.setdefault(recipient, {})[sender] = count
+
+    def start(self):
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.connection = self.connection_factory(self.parameters)
+                self.channel = self.connection.channel()
+                self.channel.queue_declare(queue=self.queue_name, durable=True)
+                self.channel.basic_qos(prefetch_count=self.prefetch)
+                self.channel.basic_consume(queue=self.queue_name, on_message_callback=self._on_message)
+                self.ready.set()
+                logger.info("Índice de mensagens offline consumindo a fila %s", self.queue_name)
+                while True:
+                    self.connection.process_data_events(time_limit=1)
+                    self._commit()
+            except Exception as e:
+                logger.error("Consumidor do índice offline caiu: %s. Reconectando...", e)
+                self.reconnects.inc()
+                self.ready.clear()
+                # Sem ack, o broker reentrega o lote que não chegou a ser gravado
+                self.batch = []
+                time.sleep(5)
+
+    def _on_message(self, channel, method, properties, body):
+        try:
+            message_data = decode_envelope(body, getattr(properties, 'content_type', None))
+            missing = [field for field in REQUIRED_FIELDS if field not in message_data]
+            if missing:
+                raise ValueError(f"campos ausentes: {', '.join(missing)}")
+        except Exception as e:
+            logger.error("Mensagem offline inválida descartada: %s", e)
+            channel.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+            return
+        self.received.inc()
+        self.batch.append((method.delivery_tag, message_data))
+
+    def _commit(self):
+        """Grava o lote recebido e o confirma no broker com um único ack"""
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        with self.lock, self.db:
+            self._insert(message_data for _, message_data in batch)
+        self.channel.basic_ack(delivery_tag=batch[-1][0], multiple=True)
+        self.acked.inc(len(batch))
+
+    def add(self, messages):
+        """Grava mensagens vindas de fora da fila (filas da versão anterior); retorna as novas"""
+        with self.lock, self.db:
+            return self._insert(messages)
+
+    def _insert(self, messages):
+        """Insere no banco e nas contagens; chamado com o lock e dentro de uma transação"""
+        added = 0
+        for message_data in messages:
+            # Reentregas (ack perdido antes de uma queda) são ignoradas pelo id
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO pending (id, recipient, sender, message, timestamp) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (message_id(message_data), message_data['recipient'], message_data['sender'],
+                 message_data['message'], message_data['timestamp'])
+            )
+            if cursor.rowcount:
+                added += 1
+                senders = self.pairs.setdefault(message_data['recipient'], {})
+                senders[message_data['sender']] = senders.get(message_data['sender'], 0) + 1
+        return added
+
+    def senders_for(self, recipient):
+        """Remetentes com mensagens pendentes para o destinatário"""
+        if self.legacy is not None:
+            self.legacy.request(recipient)
+        with self.lock:
+            return list(self.pairs.get(recipient, ()))
+
+    def take(self, recipient, sender):
+        """Remove e retorna, por horário, as mensagens pendentes de sender para recipient"""
+        if self.legacy is not None:
+            self.legacy.request(recipient)
+        with self.lock:
+            senders = self.pairs.get(recipient)
+            if not senders or sender not in senders:
+                return []
+            with self.db:
+                rows = self.db.execute(
+                    "SELECT id, message, timestamp FROM pending "
+                    "WHERE recipient = ? AND sender = ? ORDER BY timestamp",
+                    (recipient, sender)
+                ).fetchall()
+                self.db.execute("DELETE FROM pending WHERE recipient = ? AND sender = ?", (recipient, sender))
+            del senders[sender]
+            if not senders:
+                del self.pairs[recipient]
+        return [
+            {'id': id_, 'sender': sender, 'recipient': recipient, 'message': message, 'timestamp': timestamp}
+            for id_, message, timestamp in rows
+        ]
+
+    def count(self):
+        """Total de mensagens pendentes no índice"""
+        with self.lock:
+            return sum(sum(senders.values()) for senders in self.pairs.values())
@@ -0,0 +1,313 @@
+import sqlite3
+import threading
+import queue
+import time
+import logging
+from collections import deque
+from concurrent.futures import Future
+
+import pika
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _Outgoing:
+    """Mensagem aguardando publicação ou confirmação"""
+    __slots__ = ('id', 'recipient', 'body', 'content_type', 'future', 'attempts', 'sent_at')
+
+    def __init__(self, id_, recipient, body, content_type, future):
+        self.id = id_
+        self.recipient = recipient
+        self.body = body
+        self.content_type = content_type
+        self.future = future
+        self.attempts = 0
+        self.sent_at = None
+
+
+class OfflinePublisher:
+    """Publica mensagens offline em segundo plano, com publisher confirms em lote.
+
+    publish() grava a mensagem em um spool local (SQLite) e retorna: a partir daí ela
+    sobrevive a quedas do broker e a reinícios do processo, e só sai do spool quando o
+    broker a confirma. Usa uma conexão assíncrona (SelectConnection): as publicações
+    seguem sem esperar o broker, e um único Basic.Ack com multiple=True confirma várias
+    de uma vez. O Future de cada mensagem é resolvido na confirmação, ou recebe a
+    exceção quando o broker a devolve sem rota ou a rejeita em max_retries tentativas;
+    nesse caso ela fica marcada no spool em vez de ser descartada.
+
+    As mensagens vão direto para a fila pela exchange padrão: o destinatário está no
+    corpo, e nenhum nome de usuário precisa caber em um padrão de binding.
+    """
+
+    def __init__(self, connection_factory, parameters, spool_path=':memory:', queue_name='offline_index',
+                 max_pending=10000, max_unconfirmed=1000, max_retries=3):
+        self.connection_factory = connection_factory  # Substituto de pika.SelectConnection
+        self.parameters = parameters
+        self.queue_name = queue_name  # Fila durável que recebe todas as mensagens offline
+        self.max_unconfirmed = max_unconfirmed  # Janela de publicações sem ack
+        self.max_retries = max_retries
+        self.pending = queue.Queue(maxsize=max_pending)  # _Outgoing ainda não publicadas
+
+        # Estado do laço de eventos, acessado apenas pela thread do publicador
+        self.connection = None
+        self.channel = None  # Definido quando o canal está pronto para publicar
+        self.retrying = deque()  # Republicadas antes das novas
+        self.delayed = []  # Aguardando o intervalo entre tentativas
+        self.unconfirmed = {}  # {delivery_tag: _Outgoing}, em ordem de publicação
+        self.returned = set()  # Ids devolvidos pelo broker (basic.return) antes do ack
+        self.next_tag = 0
+        self.reconnect_delay = 1
+
+        self.wake_lock = threading.Lock()
+        self.wake_scheduled = False
+
+        self.publish_latency = metrics.histogram('rabbitmq_publish_seconds')  # Até a confirmação
+        self.confirm_batch = metrics.histogram(
+            'rabbitmq_confirm_batch_size', buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+        )
+        self.retries = metrics.counter('rabbitmq_publish_retries_total')
+        self.failures = metrics.counter('rabbitmq_publish_failures_total')
+        self.reconnects = metrics.counter('rabbitmq_publisher_connections_total')
+        self.rejected = metrics.counter('rabbitmq_publish_rejected_total')
+
+        # Usado pelas threads de requisição (publish) e pela thread do publicador (confirms)
+        self.spool_lock = threading.Lock()
+        self.spool = sqlite3.connect(spool_path, check_same_thread=False)
+        with self.spool_lock, self.spool:
+            self.spool.execute("PRAGMA journal_mode=WAL")
+            self.spool.execute("PRAGMA synchronous=FULL")  # fsync a cada commit
+            self.spool.execute("""
+                CREATE TABLE IF NOT EXISTS spool (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    recipient TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    content_type TEXT NOT NULL,
+                    failed INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            rows = self.spool.execute(
+                "SELECT seq, recipient, body, content_type FROM spool WHERE failed = 0 ORDER BY seq"
+            ).fetchall()
+        if rows:
+            # Gravadas antes de um reinício e ainda sem confirmação: publicadas antes das novas
+            logger.info("%d mensagens offline do spool aguardando publicação", len(rows))
+            self.retrying.extend(
+                _Outgoing(str(seq), recipient, body, content_type, Future())
+                for seq, recipient, body, content_type in rows
+            )
+
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def publish(self, recipient, body, content_type='application/json'):
+        """Grava a mensagem no spool e retorna um Future com a confirmação do broker.
+
+        Se a mensagem não puder ser gravada, o Future já volta com a exceção.
+        """
+        future = Future()
+        try:
+            with self.spool_lock, self.spool:
+                seq = self.spool.execute(
+                    "INSERT INTO spool (recipient, body, content_type) VALUES (?, ?, ?)",
+                    (recipient, body, content_type)
+                ).lastrowid
+                # Dentro da transação: com a fila cheia, a mensagem não fica no spool
+                self.pending.put_nowait(_Outgoing(str(seq), recipient, body, content_type, future))
+        except queue.Full:
+            self.rejected.inc()
+            future.set_exception(Exception("Fila local de publicação cheia"))
+            return future
+        except sqlite3.Error as e:
+            self.rejected.inc()
+            future.set_exception(e)
+            return future
+        self._wake()
+        return future
+
+    def flush(self, timeout=None):
+        """Aguarda até que o spool não tenha mensagens à espera de confirmação"""
+        deadline = None if timeout is None else time.time() + timeout
+        while self.spooled():
+            if deadline is not None and time.time() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def spooled(self):
+        """Mensagens gravadas e ainda não confirmadas pelo broker (sem contar as que falharam)"""
+        with self.spool_lock:
+            return self.spool.execute("SELECT COUNT(*) FROM spool WHERE failed = 0").fetchone()[0]
+
+    def _wake(self):
+        """Agenda a publicação das pendentes no laço de eventos (chamado de qualquer thread)"""
+        with self.wake_lock:
+            if self.wake_scheduled or self.channel is None:
+                # Sem canal pronto, as pendentes são publicadas quando ele abrir
+                return
+            self.wake_scheduled = True
+            connection = self.connection
+        try:
+            connection.ioloop.add_callback_threadsafe(self._drain)
+        except Exception as e:
+            logger.debug("Conexão do publicador indisponível: %s", e)
+            with self.wake_lock:
+                self.wake_scheduled = False
+
+    def _run(self):
+        while True:
+            self.connection = self.connection_factory(
+                self.parameters,
+                on_open_callback=self._on_connection_open,
+                on_open_error_callback=self._on_connection_error,
+                on_close_callback=self._on_connection_closed
+            )
+            self.connection.ioloop.start()
+            # O laço para quando a conexão cai; as mensagens sem ack voltam para a fila
+            self._requeue_unconfirmed()
+            time.sleep(self.reconnect_delay)
+            self.reconnect_delay = min(30, self.reconnect_delay * 2)
+
+    def _on_connection_open(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_error(self, connection, error):
+        logger.warning("Publicador não conectou ao RabbitMQ: %s", error)
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        logger.warning("Conexão do publicador fechada: %s", reason)
+        self.channel = None
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.add_on_return_callback(self._on_return)
+        channel.confirm_delivery(
+            self._on_confirm,
+            callback=lambda _: channel.queue_declare(
+                queue=self.queue_name, durable=True, callback=lambda _: self._on_ready(channel)
+            )
+        )
+
+    def _on_channel_closed(self, channel, reason):
+        logger.warning("Canal do publicador fechado: %s", reason)
+        self.channel = None
+        if self.connection.is_open:
+            self.connection.close()
+
+    def _on_ready(self, channel):
+        """Canal em modo confirm e fila declarada: começar a publicar"""
+        self.reconnects.inc()
+        self.reconnect_delay = 1
+        self.next_tag = 0
+        self.channel = channel
+        self._drain()
+
+    def _drain(self):
+        """Publica as pendentes até encher a janela de mensagens sem confirmação"""
+        with self.wake_lock:
+            self.wake_scheduled = False
+        while self.channel is not None and len(self.unconfirmed) < self.max_unconfirmed:
+            if self.retrying:
+                item = self.retrying.popleft()
+            else:
+                try:
+                    item = self.pending.get_nowait()
+                except queue.Empty:
+                    return
+            try:
+                self.channel.basic_publish(
+                    exchange='',
+                    routing_key=self.queue_name,
+                    body=item.body,
+                    properties=pika.BasicProperties(
+                        delivery_mode=2,
+                        content_type=item.content_type,
+                        message_id=item.id
+                    ),
+                    mandatory=True
+                )
+            except Exception as e:
+                # Canal fechando: a mensagem é republicada no próximo canal
+                logger.debug("Publicação interrompida: %s", e)
+                self.retrying.appendleft(item)
+                return
+            self.next_tag += 1
+            item.sent_at = time.perf_counter()
+            self.unconfirmed[self.next_tag] = item
+
+    def _on_return(self, channel, method, properties, body):
+        # Com mandatory=True, o broker devolve a mensagem sem rota e depois envia o ack
+        self.returned.add(properties.message_id)
+
+    def _on_confirm(self, frame):
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        if method.multiple:
+            tags = []
+            for tag in self.unconfirmed:
+                if tag > method.delivery_tag:
+                    break
+                tags.append(tag)
+        else:
+            tags = [method.delivery_tag]
+        self.confirm_batch.observe(len(tags))
+
+        now = time.perf_counter()
+        confirmed = []
+        for tag in tags:
+            item = self.unconfirmed.pop(tag, None)
+            if item is None:
+                continue
+            if item.id in self.returned:
+                self.returned.discard(item.id)
+                self._retry(item, Exception(f"Mensagem para {item.recipient} sem rota até a fila {self.queue_name}"))
+            elif not acked:
+                self._retry(item, Exception("Mensagem rejeitada pelo broker"))
+            else:
+                self.publish_latency.observe(now - item.sent_at)
+                confirmed.append(item)
+        if confirmed:
+            # Um único commit por Basic.Ack
+            with self.spool_lock, self.spool:
+                self.spool.executemany("DELETE FROM spool WHERE seq = ?", [(int(item.id),) for item in confirmed])
+            for item in confirmed:
+                item.future.set_result(True)
+        self._drain()
+
+    def _retry(self, item, error):
+        item.attempts += 1
+        if item.attempts >= self.max_retries:
+            self.failures.inc()
+            logger.error("Mensagem para %s mantida no spool (seq %s) após %d tentativas: %s",
+                         item.recipient, item.id, item.attempts, error)
+            with self.spool_lock, self.spool:
+                self.spool.execute("UPDATE spool SET failed = 1 WHERE seq = ?", (int(item.id),))
+            item.future.set_exception(error)
+            return
+        self.retries.inc()
+        logger.warning("Tentativa %d de publicar mensagem para %s falhou: %s", item.attempts, item.recipient, error)
+
+        self.delayed.append(item)
+
+        def again():
+            if item in self.delayed:  # Ou já devolvida por _requeue_unconfirmed
+                self.delayed.remove(item)
+                self.retrying.append(item)
+                self._drain()
+
+        self.connection.ioloop.call_later(2 ** (item.attempts - 1), again)
+
+    def _requeue_unconfirmed(self):
+        """Devolve à frente da fila as mensagens cuja confirmação se perdeu com a conexão"""
+        # Continuam no spool: uma queda do broker não conta como tentativa
+        self.retrying.extendleft(reversed(list(self.unconfirmed.values())))
+        self.unconfirmed.clear()
+        self.returned.clear()
+        # Os temporizadores de nova tentativa morreram com o laço de eventos
+        self.retrying.extend(self.delayed)
+        self.delayed.clear()
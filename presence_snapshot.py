@@ -0,0 +1,72 @@
+import mmap
+import os
+import struct
+import time
+
+_HEADER = struct.Struct('<2sBIdI')  # magic, versão, quantidade, momento da gravação, bytes de texto
+_RECORD = struct.Struct('<ddd')  # lat, lon, last_active
+_SEPARATOR = '\x00'
+
+
+class PresenceSnapshot:
+    """Snapshot binário do registro de usuários em um arquivo mapeado em memória.
+
+    O arquivo tem uma seção de registros numéricos de tamanho fixo seguida de um bloco
+    de texto com username e uri separados por NUL, para que a leitura decodifique
+    tudo em poucas chamadas. A gravação escreve direto no mapeamento de um arquivo
+    temporário e o troca de forma atômica pelo anterior.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def save(self, entries):
+        """Grava [(username, data)] no formato de UserRegistry.items(); retorna a quantidade"""
+        numbers = []
+        texts = []
+        for username, data in entries:
+            lat, lon = data['location']
+            numbers.extend((lat, lon, data['last_active']))
+            texts.append(username)
+            texts.append(data['uri'])
+        count = len(texts) // 2
+        text = _SEPARATOR.join(texts).encode('utf-8')
+        records_size = _RECORD.size * count
+        size = _HEADER.size + records_size + len(text)
+
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w+b') as file:
+            file.truncate(size)
+            with mmap.mmap(file.fileno(), size) as mapped:
+                _HEADER.pack_into(mapped, 0, b'PS', 2, count, time.time(), len(text))
+                struct.pack_into(f'<{len(numbers)}d', mapped, _HEADER.size, *numbers)
+                mapped[_HEADER.size + records_size:] = text
+                mapped.flush()
+        os.replace(temporary, self.path)
+        return count
+
+    def load(self):
+        """Retorna [(username, localização, last_active, uri)], ou [] sem snapshot"""
+        try:
+            file = open(self.path, 'rb')
+        except FileNotFoundError:
+            return []
+
+        with file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                magic, version, count, _, text_size = _HEADER.unpack_from(mapped, 0)
+                if magic != b'PS' or version != 2:
+                    raise ValueError("Formato de snapshot desconhecido")
+                start = _HEADER.size
+                end = start + _RECORD.size * count
+                numbers = _RECORD.iter_unpack(mapped[start:end])
+                texts = mapped[end:end + text_size].decode('utf-8').split(_SEPARATOR) if count else []
+
+        if len(texts) != 2 * count:
+            raise ValueError("Snapshot truncado")
+        return [
+            (texts[2 * i], (lat, lon), last_active, texts[2 * i + 1])
+            for i, (lat, lon, last_active) in enumerate(numbers)
+        ]
@@ -0,0 +1,112 @@
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # NumPy é opcional; sem ele o servidor usa apenas a grade espacial
+    np = None
+
+from spatial_grid import METERS_PER_DEGREE
+
+
+class VectorizedProximityEngine:
+    """Armazenamento colunar de coordenadas com cálculo vetorizado de distâncias"""
+
+    def __init__(self, capacity=1024, chunk_size=2048):
+        if np is None:
+            raise RuntimeError("NumPy não está instalado; motor vetorizado indisponível")
+
+        self.lats = np.zeros(capacity, dtype=np.float64)
+        self.lons = np.zeros(capacity, dtype=np.float64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.slot_of = {}  # {username: slot}
+        self.usernames = [None] * capacity  # slot -> username
+        self.free_slots = list(range(capacity - 1, -1, -1))
+        self.chunk_size = chunk_size  # Linhas por bloco na consulta de todos os pares
+        self.lock = threading.Lock()  # Alterado pelas threads de requisição do Pyro
+
+    def _grow(self):
+        """Dobra a capacidade dos arrays quando não há slots livres"""
+        old_capacity = len(self.lats)
+        new_capacity = old_capacity * 2
+        for name in ('lats', 'lons', 'active'):
+            old = getattr(self, name)
+            new = np.zeros(new_capacity, dtype=old.dtype)
+            new[:old_capacity] = old
+            setattr(self, name, new)
+        self.usernames.extend([None] * old_capacity)
+        self.free_slots.extend(range(new_capacity - 1, old_capacity - 1, -1))
+
+    def add(self, username, location):
+        """Insere ou atualiza a posição de um usuário"""
+        with self.lock:
+            slot = self.slot_of.get(username)
+            if slot is None:
+                if not self.free_slots:
+                    self._grow()
+                slot = self.free_slots.pop()
+                self.slot_of[username] = slot
+                self.usernames[slot] = username
+                self.active[slot] = True
+            self.lats[slot] = location[0]
+            self.lons[slot] = location[1]
+
+    move = add
+
+    def remove(self, username):
+        """Libera o slot de um usuário"""
+        with self.lock:
+            slot = self.slot_of.pop(username, None)
+            if slot is None:
+                return
+            self.active[slot] = False
+            self.usernames[slot] = None
+            self.free_slots.append(slot)
+
+    def _distances_from(self, lat, lon):
+        # Mesma aproximação de ChatServer.calculate_distance (escala pela latitude de origem)
+        lat_diff = (lat - self.lats) * METERS_PER_DEGREE
+        lon_diff = (lon - self.lons) * (METERS_PER_DEGREE * abs(np.cos(np.radians(lat))))
+        return np.sqrt(lat_diff * lat_diff + lon_diff * lon_diff)
+
+    def nearby(self, username, radius=200):
+        """Retorna [(username, distância)] dos usuários dentro do raio"""
+        with self.lock:
+            slot = self.slot_of.get(username)
+            if slot is None:
+                return []
+            distances = self._distances_from(self.lats[slot], self.lons[slot])
+            mask = self.active & (distances <= radius)
+            mask[slot] = False
+            return [(self.usernames[i], float(distances[i])) for i in np.flatnonzero(mask)]
+
+    def all_neighbourhoods(self, radius=200):
+        """Retorna {username: [(vizinho, distância)]} para todos os usuários"""
+        # Cópia dos arrays sob o lock; o cálculo pesado roda sem bloquear as atualizações
+        with self.lock:
+            slots = np.flatnonzero(self.active)
+            lats = self.lats[slots]
+            lons = self.lons[slots]
+            names = [self.usernames[i] for i in slots]
+        result = {name: [] for name in names}
+
+        # Processa em blocos de linhas para limitar a memória da matriz de distâncias
+        for start in range(0, len(slots), self.chunk_size):
+            stop = min(start + self.chunk_size, len(slots))
+            block_lats = lats[start:stop, None]
+            lon_scale = METERS_PER_DEGREE * np.abs(np.cos(np.radians(block_lats)))
+            lat_diff = (block_lats - lats[None, :]) * METERS_PER_DEGREE
+            lon_diff = (lons[start:stop, None] - lons[None, :]) * lon_scale
+            distances = np.sqrt(lat_diff * lat_diff + lon_diff * lon_diff)
+
+            rows, cols = np.nonzero(distances <= radius)
+            for row, col in zip(rows, cols):
+                origin = start + row
+                if origin != col:
+                    result[names[origin]].append((names[col], float(distances[row, col])))
+        return result
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def __contains__(self, username):
+        return username in self.slot_of
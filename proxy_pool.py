@@ -0,0 +1,100 @@
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import Pyro4
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ProxyPool:
+    """Pool LRU de proxies Pyro por URI, com checkout exclusivo por thread"""
+
+    def __init__(self, max_size=256, connect_timeout=5):
+        self.max_size = max_size
+        self.connect_timeout = connect_timeout
+        self.idle = OrderedDict()  # {uri: [proxies ociosos]}, do menos para o mais recente
+        self.idle_count = 0
+        self.lock = threading.Lock()
+        self.created = metrics.counter('pyro_proxies_created_total')
+        self.reused = metrics.counter('pyro_proxies_reused_total')
+        self.connect_errors = metrics.counter('pyro_proxy_connect_errors_total')
+        self.connect_latency = metrics.histogram('pyro_proxy_connect_seconds')
+
+    def _create(self, uri):
+        proxy = Pyro4.Proxy(uri)
+        # Limita conexão e chamada para que um cliente travado não prenda a thread
+        proxy._pyroTimeout = self.connect_timeout
+        self.created.inc()
+        try:
+            # Conectar já aqui (e não na primeira chamada) para medir a criação do proxy
+            with self.connect_latency.time():
+                proxy._pyroBind()
+        except Exception:
+            self.connect_errors.inc()
+            raise
+        return proxy
+
+    @contextmanager
+    def checkout(self, uri):
+        """Empresta um proxy para o URI; ele volta ao pool se a chamada não falhar"""
+        proxy = None
+        with self.lock:
+            proxies = self.idle.get(uri)
+            if proxies:
+                proxy = proxies.pop()
+                self.idle_count -= 1
+                if not proxies:
+                    del self.idle[uri]
+        if proxy is None:
+            proxy = self._create(uri)
+        else:
+            self.reused.inc()
+
+        try:
+            yield proxy
+        except Exception:
+            # A conexão pode estar quebrada: não reaproveitar
+            self._release(proxy)
+            raise
+        else:
+            self._return(uri, proxy)
+
+    def _return(self, uri, proxy):
+        evicted = []
+        with self.lock:
+            self.idle.setdefault(uri, []).append(proxy)
+            self.idle.move_to_end(uri)
+            self.idle_count += 1
+            while self.idle_count > self.max_size:
+                oldest_uri, proxies = next(iter(self.idle.items()))
+                evicted.append(proxies.pop(0))
+                self.idle_count -= 1
+                if not proxies:
+                    del self.idle[oldest_uri]
+        for old in evicted:
+            self._release(old)
+
+    def evict(self, uri):
+        """Fecha os proxies de um URI (usuário removido ou inativo)"""
+        with self.lock:
+            proxies = self.idle.pop(uri, [])
+            self.idle_count -= len(proxies)
+        for proxy in proxies:
+            self._release(proxy)
+
+    def _release(self, proxy):
+        try:
+            proxy._pyroRelease()
+        except Exception as e:
+            logger.debug("Erro ao liberar proxy: %s", e)
+
+    def close(self):
+        """Fecha todos os proxies ociosos"""
+        with self.lock:
+            uris = list(self.idle)
+        for uri in uris:
+            self.evict(uri)
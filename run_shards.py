@@ -0,0 +1,38 @@
+"""Sobe um name server local e um processo ChatServer por shard, para testes em uma máquina.
+
+Uso: python run_shards.py [shards] [opções do chat_server, ex.: --vectorized]
+Os clientes devem rodar com a mesma variável CHAT_SHARDS.
+"""
+import os
+import subprocess
+import sys
+import time
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    extra = sys.argv[2:]
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, CHAT_SHARDS=str(count))
+
+    processes = [subprocess.Popen([sys.executable, 'name_server.py'], cwd=here, env=env)]
+    time.sleep(1)  # Os shards se registram no name server ao iniciar
+    for shard in range(count):
+        processes.append(subprocess.Popen(
+            [sys.executable, 'chat_server.py', '--shard', str(shard)] + extra,
+            cwd=here, env=env
+        ))
+    print(f"{count} shards iniciados. Clientes: CHAT_SHARDS={count} python chat_client.py")
+
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+import os
+from bisect import bisect_right
+from math import cos, radians
+
+from spatial_grid import METERS_PER_DEGREE
+
+SERVER_NAME = 'chat.server'
+
+
+class ShardMap:
+    """Divide a área atendida em faixas de longitude, uma por processo ChatServer.
+
+    As faixas das pontas se estendem indefinidamente, então toda localização
+    pertence a exatamente um shard. O servidor e o cliente devem usar o mesmo mapa.
+    """
+
+    def __init__(self, count=1, west=-46.7, east=-46.6):
+        if count < 1:
+            raise ValueError("O número de shards deve ser positivo")
+        self.count = count
+        self.west = west
+        self.east = east
+        width = (east - west) / count
+        self.edges = [west + width * i for i in range(1, count)]  # Fronteiras internas
+
+    @classmethod
+    def from_env(cls):
+        """Mapa configurado por CHAT_SHARDS, CHAT_SHARD_WEST e CHAT_SHARD_EAST"""
+        return cls(
+            count=int(os.environ.get("CHAT_SHARDS", "1")),
+            west=float(os.environ.get("CHAT_SHARD_WEST", "-46.7")),
+            east=float(os.environ.get("CHAT_SHARD_EAST", "-46.6"))
+        )
+
+    @property
+    def sharded(self):
+        return self.count > 1
+
+    def shard_for(self, location):
+        """Shard dono da localização"""
+        return bisect_right(self.edges, location[1])
+
+    def shards_for_area(self, location, radius):
+        """Shards cujas faixas cruzam o círculo de raio (metros) em torno da localização"""
+        lon_to_meters = METERS_PER_DEGREE * max(abs(cos(radians(location[0]))), 1e-9)
+        delta = radius / lon_to_meters
+        first = bisect_right(self.edges, location[1] - delta)
+        last = bisect_right(self.edges, location[1] + delta)
+        return range(first, last + 1)
+
+    def name(self, shard):
+        """Nome do shard no name server ('chat.server' na implantação sem shards)"""
+        if not self.sharded:
+            return SERVER_NAME
+        return f"{SERVER_NAME}.{shard}"
+
+    def uri(self, shard):
+        return f"PYRONAME:{self.name(shard)}"
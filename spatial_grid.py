@@ -0,0 +1,113 @@
+import threading
+from math import sqrt, cos, radians, floor
+
+# 1 grau de latitude ≈ 111.32 km
+METERS_PER_DEGREE = 111320
+
+
+def distance_meters(loc1, loc2):
+    """Distância aproximada em metros; usada também por ChatServer.calculate_distance"""
+    lat_diff = (loc1[0] - loc2[0]) * METERS_PER_DEGREE
+    lon_diff = (loc1[1] - loc2[1]) * METERS_PER_DEGREE * abs(cos(radians(loc1[0])))
+    return sqrt(lat_diff**2 + lon_diff**2)
+
+
+class SpatialGrid:
+    """Índice espacial em grade fixa para buscas de usuários próximos"""
+
+    def __init__(self, radius=200):
+        self.radius = radius
+        # Células quadradas (em graus) com lado equivalente ao raio em latitude
+        self.cell_size = radius / METERS_PER_DEGREE
+        self.cells = {}  # {(linha, coluna): set(usernames)}
+        self.user_cells = {}  # {username: (linha, coluna)}
+        self.lock = threading.Lock()  # Alterado pelas threads de requisição do Pyro
+
+    def cell_for(self, location):
+        """Retorna a célula que contém a localização"""
+        return (floor(location[0] / self.cell_size), floor(location[1] / self.cell_size))
+
+    def add(self, username, location):
+        """Insere ou move um usuário para a célula da nova localização"""
+        cell = self.cell_for(location)
+        with self.lock:
+            old_cell = self.user_cells.get(username)
+            if old_cell == cell:
+                return
+            if old_cell is not None:
+                self._discard(username, old_cell)
+            self.cells.setdefault(cell, set()).add(username)
+            self.user_cells[username] = cell
+
+    # Mover é o mesmo que reinserir: só há trabalho se a célula mudar
+    move = add
+
+    def add_many(self, entries):
+        """Insere [(username, localização)] de uma vez, sob um único lock"""
+        with self.lock:
+            for username, location in entries:
+                cell = self.cell_for(location)
+                old_cell = self.user_cells.get(username)
+                if old_cell == cell:
+                    continue
+                if old_cell is not None:
+                    self._discard(username, old_cell)
+                self.cells.setdefault(cell, set()).add(username)
+                self.user_cells[username] = cell
+
+    def remove(self, username):
+        """Remove um usuário do índice"""
+        with self.lock:
+            cell = self.user_cells.pop(username, None)
+            if cell is not None:
+                self._discard(username, cell)
+
+    def _discard(self, username, cell):
+        members = self.cells.get(cell)
+        if members is None:
+            return
+        members.discard(username)
+        if not members:
+            del self.cells[cell]
+
+    def candidates(self, location, radius=None):
+        """Retorna os usuários das células que podem estar dentro do raio"""
+        radius = self.radius if radius is None else radius
+        lat, lon = location
+
+        # A escala da longitude usa a latitude de origem, como em calculate_distance
+        lat_span = radius / METERS_PER_DEGREE
+        lon_scale = abs(cos(radians(lat)))
+        if lon_scale < 1e-9:
+            # Nos polos qualquer longitude está a zero metros
+            with self.lock:
+                return set(self.user_cells)
+        lon_span = radius / (METERS_PER_DEGREE * lon_scale)
+
+        min_row = floor((lat - lat_span) / self.cell_size)
+        max_row = floor((lat + lat_span) / self.cell_size)
+        min_col = floor((lon - lon_span) / self.cell_size)
+        max_col = floor((lon + lon_span) / self.cell_size)
+
+        # Em latitudes altas a faixa de colunas cresce; se for maior que o
+        # número de células ocupadas, é mais barato percorrer as células
+        result = set()
+        with self.lock:
+            if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self.cells):
+                for (row, col), members in self.cells.items():
+                    if min_row <= row <= max_row and min_col <= col <= max_col:
+                        result.update(members)
+                return result
+
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    members = self.cells.get((row, col))
+                    if members:
+                        result.update(members)
+        return result
+
+    def __len__(self):
+        return len(self.user_cells)
+
+    def __contains__(self, username):
+        return username in self.user_cells
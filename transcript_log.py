@@ -0,0 +1,62 @@
+import os
+import threading
+
+
+class TranscriptLog:
+    """Histórico da conversa em arquivo, uma linha por mensagem, com leitura por intervalo.
+
+    Os offsets de cada linha ficam em memória para que páginas antigas sejam lidas
+    com um seek, sem percorrer o arquivo.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = []  # Offset em bytes do início de cada linha
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'a+b')
+        self._index()
+
+    def _index(self):
+        self.file.seek(0)
+        offset = 0
+        for line in self.file:
+            self.offsets.append(offset)
+            offset += len(line)
+        self.end = offset
+
+    def append(self, lines):
+        """Acrescenta linhas (sem o '\\n' final) ao fim do arquivo"""
+        if not lines:
+            return
+        data = b''.join(line.encode('utf-8') + b'\n' for line in lines)
+        with self.lock:
+            self.file.write(data)
+            self.file.flush()
+            offset = self.end
+            for line in lines:
+                self.offsets.append(offset)
+                offset += len(line.encode('utf-8')) + 1
+            self.end = offset
+
+    def read(self, start, stop):
+        """Linhas no intervalo [start, stop)"""
+        with self.lock:
+            start = max(0, start)
+            stop = min(stop, len(self.offsets))
+            if start >= stop:
+                return []
+            end = self.offsets[stop] if stop < len(self.offsets) else self.end
+            self.file.seek(self.offsets[start])
+            data = self.file.read(end - self.offsets[start])
+        # split('\n'): splitlines também quebraria em \r, \x0b, \u2028 etc. dentro das mensagens
+        return data.decode('utf-8').split('\n')[:-1]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
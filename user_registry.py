@@ -0,0 +1,75 @@
+import threading
+from zlib import crc32
+
+
+class UserRegistry:
+    """Registro de usuários dividido em shards, cada um com seu próprio lock.
+
+    As entradas são imutáveis na prática: cada atualização substitui o dicionário do
+    usuário por uma cópia, então leituras com get() nunca veem um estado parcial.
+    """
+
+    def __init__(self, shards=16):
+        self.shards = [({}, threading.Lock()) for _ in range(shards)]
+
+    def _shard(self, username):
+        return self.shards[crc32(username.encode('utf-8')) % len(self.shards)]
+
+    def get(self, username, default=None):
+        users, _ = self._shard(username)
+        return users.get(username, default)
+
+    def __getitem__(self, username):
+        users, _ = self._shard(username)
+        return users[username]
+
+    def __setitem__(self, username, data):
+        users, lock = self._shard(username)
+        with lock:
+            users[username] = dict(data)
+
+    def load(self, entries):
+        """Insere [(username, data)] em lote, com um lock por shard (restauração no boot)"""
+        grouped = {}
+        for username, data in entries:
+            grouped.setdefault(crc32(username.encode('utf-8')) % len(self.shards), []).append((username, data))
+        for index, shard_entries in grouped.items():
+            users, lock = self.shards[index]
+            with lock:
+                users.update(shard_entries)
+
+    def __contains__(self, username):
+        users, _ = self._shard(username)
+        return username in users
+
+    def pop(self, username, default=None):
+        users, lock = self._shard(username)
+        with lock:
+            return users.pop(username, default)
+
+    def update(self, username, **fields):
+        """Atualiza campos de um usuário existente; retorna False se ele não existir"""
+        users, lock = self._shard(username)
+        with lock:
+            data = users.get(username)
+            if data is None:
+                return False
+            users[username] = {**data, **fields}
+            return True
+
+    def items(self):
+        """Cópia consistente de cada shard, segura para iterar enquanto outras threads alteram"""
+        result = []
+        for users, lock in self.shards:
+            with lock:
+                result.extend(users.items())
+        return result
+
+    def __iter__(self):
+        return iter([username for username, _ in self.items()])
+
+    def __len__(self):
+        return sum(len(users) for users, _ in self.shards)
+
+    def __repr__(self):
+        return f"UserRegistry({dict(self.items())!r})"
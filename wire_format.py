@@ -0,0 +1,107 @@
+import json
+import struct
+import uuid
+from datetime import datetime
+
+# Formatos que o servidor sabe produzir, em ordem de preferência
+NEARBY_FORMATS = ['packed-v1', 'dicts']
+
+ENVELOPE_CONTENT_TYPE = 'application/x-chat-envelope'
+JSON_CONTENT_TYPE = 'application/json'
+
+_NEARBY_HEADER = struct.Struct('>2sBI')  # magic, versão, quantidade de strings
+_ENVELOPE_HEADER = struct.Struct('>2sB16sq')  # magic, versão, id (uuid), timestamp em ms
+_STRING_LENGTH = struct.Struct('>H')
+_COUNT = struct.Struct('>I')
+_NEARBY_ROW = struct.Struct('>IIddf')  # username, uri (índices na tabela), lat, lon, distância
+
+
+def _pack_string(value):
+    data = value.encode('utf-8')
+    return _STRING_LENGTH.pack(len(data)) + data
+
+
+def _unpack_string(buffer, offset):
+    (length,) = _STRING_LENGTH.unpack_from(buffer, offset)
+    offset += _STRING_LENGTH.size
+    return buffer[offset:offset + length].decode('utf-8'), offset + length
+
+
+def encode_nearby(entries):
+    """Codifica a lista de get_nearby_users com tabela de strings e linhas de tamanho fixo"""
+    strings = {}
+    rows = []
+    for entry in entries:
+        name_index = strings.setdefault(entry['username'], len(strings))
+        uri_index = strings.setdefault(entry['uri'], len(strings))
+        lat, lon = entry['location']
+        rows.append(_NEARBY_ROW.pack(name_index, uri_index, lat, lon, entry['distance']))
+
+    parts = [_NEARBY_HEADER.pack(b'NB', 1, len(strings))]
+    parts.extend(_pack_string(value) for value in strings)
+    parts.append(_COUNT.pack(len(rows)))
+    parts.extend(rows)
+    return b''.join(parts)
+
+
+def decode_nearby(data):
+    """Reconstrói a lista de dicionários produzida por get_nearby_users"""
+    data = bytes(data)
+    magic, version, string_count = _NEARBY_HEADER.unpack_from(data, 0)
+    if magic != b'NB' or version != 1:
+        raise ValueError("Formato de lista de vizinhos desconhecido")
+    offset = _NEARBY_HEADER.size
+    strings = []
+    for _ in range(string_count):
+        value, offset = _unpack_string(data, offset)
+        strings.append(value)
+    (row_count,) = _COUNT.unpack_from(data, offset)
+    offset += _COUNT.size
+
+    entries = []
+    for name_index, uri_index, lat, lon, distance in _NEARBY_ROW.iter_unpack(
+            data[offset:offset + row_count * _NEARBY_ROW.size]):
+        entries.append({
+            'username': strings[name_index],
+            'location': (lat, lon),
+            'distance': distance,
+            'uri': strings[uri_index]
+        })
+    return entries
+
+
+def encode_envelope(message_data):
+    """Codifica uma mensagem offline; retorna (corpo, content_type)"""
+    timestamp = datetime.fromisoformat(message_data['timestamp'])
+    body = b''.join([
+        _ENVELOPE_HEADER.pack(
+            b'EM', 1,
+            uuid.UUID(hex=message_data['id']).bytes,
+            int(timestamp.timestamp() * 1000)
+        ),
+        _pack_string(message_data['sender']),
+        _pack_string(message_data['recipient']),
+        message_data['message'].encode('utf-8')
+    ])
+    return body, ENVELOPE_CONTENT_TYPE
+
+
+def decode_envelope(body, content_type=None):
+    """Decodifica o corpo de uma mensagem offline, binário ou JSON (formato anterior)"""
+    if content_type != ENVELOPE_CONTENT_TYPE:
+        return json.loads(body)
+
+    magic, version, raw_id, timestamp_ms = _ENVELOPE_HEADER.unpack_from(body, 0)
+    if magic != b'EM' or version != 1:
+        raise ValueError("Formato de envelope desconhecido")
+    offset = _ENVELOPE_HEADER.size
+    sender, offset = _unpack_string(body, offset)
+    recipient, offset = _unpack_string(body, offset)
+    return {
+        'id': uuid.UUID(bytes=raw_id).hex,
+        'sender': sender,
+        'recipient': recipient,
+        'message': body[offset:].decode('utf-8'),
+        # Os clientes continuam recebendo o timestamp ISO
+        'timestamp': datetime.fromtimestamp(timestamp_ms / 1000).isoformat()
+    }